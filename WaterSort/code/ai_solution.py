@@ -1,80 +1,408 @@
+import os
+from time import perf_counter
+from types import SimpleNamespace
+from packed_board import PackedBoard
+from search_stats import SearchStats
+
+
+# Searches whose solutions are shortest, so they may be stored as optimal in a SolutionCache
+OPTIMAL_METHODS = ("solve", "optimal_solve", "layer_solve", "external_solve")
+
+# Weights used by the parallel portfolio; worker k runs weighted best-first with PORTFOLIO_WEIGHTS[k % len]
+PORTFOLIO_WEIGHTS = (1.0, 2.0, 3.0, 5.0, 1.5, 8.0, 2.5, 4.0)
+
+# Weights of the successive anytime_solve runs; the first is large enough to be practically greedy
+ANYTIME_WEIGHTS = (100.0, 5.0, 3.0, 2.0, 1.5, 1.0)
+
+
+def _portfolio_search(job):
+    # Runs in a pool process, so it only receives plain picklable values
+    config, tube_colors, weight, seed, pattern_db = job
+    solution = GameSolution(config, pattern_db=pattern_db)
+    solution.best_first_solve(tube_colors, weight, seed)
+    return solution.solution_found, solution.moves, solution.stats
+
+
 class GameSolution:
-    def __init__(self, game):
+    def __init__(self, game, canonical=True, cache=None, progress=None, progress_interval=1.0, pattern_db=None):
         self.ws_game = game
+        self.cache = cache  # optional SolutionCache checked by cached_solve
+        # Optional PatternDatabase built for this board configuration, used by the heuristic searches
+        self.pattern_db = pattern_db
+        self._splits = None
         self.moves = []
         self.tube_numbers = game.NEmptyTubes + game.NColor
         self.solution_found = False
-        self.visited_tubes = set()
+        # state key -> (parent state, move) for every state reached so far
+        self.visited_tubes = {}
+        # Progress and cancellation, read and set from other threads while a search runs.
+        # progress is called with the stats every progress_interval seconds.
+        self.stats = SearchStats(progress, progress_interval)
+        self.cancelled = False
+        self.board = PackedBoard(self.tube_numbers, game.NColorInTube)
+        # With canonical keys, boards that only differ in tube order count as one visited state.
+        # The frontier still holds the real boards, so the moves keep the real tube indices.
+        self.canonical = canonical
+        self._key = self.board.canonical if canonical else bytes
+
+    def cancel(self):
+        # Ask a running search to stop at its next expansion
+        self.cancelled = True
+
+    def cached_solve(self, current_state, method="solve", **options):
+        # Answer from the cache when the board is known, otherwise run the search and store its result.
+        # options are passed on to the search, e.g. the deadline of anytime_solve.
+        capacity = self.ws_game.NColorInTube
+        optimal = method in OPTIMAL_METHODS
+        if self.cache is not None:
+            moves = self.cache.get(current_state, capacity, optimal)
+            if moves is not None:
+                self.solution_found = True
+                self.moves = moves
+                self.stats.finish()
+                return
+        getattr(self, method)(current_state, **options)
+        if self.cache is not None and self.solution_found:
+            self.cache.put(current_state, capacity, self.moves, optimal)
+
+    def _build_path(self, state):
+        # Walk the parent links back to the start and return the moves in order
+        path = []
+        parent, move = self.visited_tubes[self._key(state)]
+        while move is not None:
+            path.append(move)
+            state = parent
+            parent, move = self.visited_tubes[self._key(state)]
+        path.reverse()
+        return path
 
     def solve(self, current_state):
         from collections import deque
-        
-        def is_solved(state):
-            # Check if the game is solved
-            return all(len(set(tube)) <= 1 for tube in state if tube)
-        
-        def get_next_states(state):
-            # Generate all possible next states from the current state
-            next_states = []
-            for i in range(self.tube_numbers):
-                for j in range(self.tube_numbers):
-                    if i != j and state[i] and (not state[j] or state[i][-1] == state[j][-1]):
-                        if len(state[j]) < self.ws_game.tube_capacity:
-                            new_state = [tube[:] for tube in state]
-                            new_state[j].append(new_state[i].pop())
-                            next_states.append((new_state, (i, j)))
-            return next_states
-
-        queue = deque([(current_state, [])])
-        self.visited_tubes.add(tuple(tuple(tube) for tube in current_state))
-        
-        while queue:
-            state, path = queue.popleft()
-            
-            if is_solved(state):
+
+        board = self.board
+        stats = self.stats
+        visited = self.visited_tubes
+        start = board.pack(current_state)
+        queue = deque([start])
+        visited[self._key(start)] = (None, None)
+
+        while queue and not self.cancelled:
+            state = queue.popleft()
+
+            if board.is_solved(state):
+                self.solution_found = True
+                self.moves = self._build_path(state)
+                break
+
+            t0 = perf_counter()
+            children = board.next_states(state)
+            t1 = perf_counter()
+            for next_state, move in children:
+                key = self._key(next_state)
+                if key not in visited:
+                    visited[key] = (state, move)
+                    queue.append(next_state)
+                else:
+                    stats.duplicate_hits += 1
+            t2 = perf_counter()
+            stats.nodes_generated += len(children)
+            stats.expansion_time += t1 - t0
+            stats.hashing_time += t2 - t1
+            stats.expanded(len(queue), len(visited), t2)
+        stats.finish()
+
+    def layer_solve(self, current_state, chunk_size=100000):
+        # BFS one whole layer at a time with array operations (see LayerBoard). Children are deduplicated
+        # in bulk against a sorted array of keys, canonical like solve's unless disabled, and every layer
+        # keeps the parent row and the move of its states, so the path is rebuilt without storing old boards.
+        import numpy as np
+        from layer_search import LayerBoard
+
+        board = LayerBoard(self.tube_numbers, self.ws_game.NColorInTube, self.canonical)
+        stats = self.stats
+        frontier = board.layer(current_state)
+        visited = board.keys(frontier)
+        layers = []  # (parent rows, moves) of every layer after the start
+        found = 0 if board.solved(frontier)[0] else None
+
+        while found is None and len(frontier) and not self.cancelled:
+            next_layer, parents, moves = [], [], []
+            for offset in range(0, len(frontier), chunk_size):
+                if self.cancelled:
+                    break
+                t0 = perf_counter()
+                children, parent, move = board.expand(frontier[offset:offset + chunk_size])
+                t1 = perf_counter()
+                keys, first = np.unique(board.keys(children), return_index=True)
+                position = np.searchsorted(visited, keys)
+                fresh = np.ones(len(keys), dtype=bool)
+                inside = position < len(visited)
+                fresh[inside] = visited[position[inside]] != keys[inside]
+                visited = np.insert(visited, position[fresh], keys[fresh])
+                keep = np.sort(first[fresh])  # in generation order, like solve
+                t2 = perf_counter()
+                next_layer.append(children[keep])
+                parents.append(parent[keep] + offset)
+                moves.append(move[keep])
+                stats.nodes_generated += len(children)
+                stats.duplicate_hits += len(children) - len(keep)
+                stats.expansion_time += t1 - t0
+                stats.hashing_time += t2 - t1
+                expanded = min(chunk_size, len(frontier) - offset)
+                waiting = len(frontier) - offset - expanded + sum(len(rows) for rows in next_layer)
+                stats.expanded(waiting, len(visited), t2, expanded)
+            if self.cancelled:
+                break
+            frontier = np.concatenate(next_layer)
+            layers.append((np.concatenate(parents), np.concatenate(moves)))
+            solved = board.solved(frontier)
+            if solved.any():
+                found = int(solved.argmax())
+
+        if found is not None:
+            path = []
+            for parents, moves in reversed(layers):
+                path.append((int(moves[found, 0]), int(moves[found, 1])))
+                found = parents[found]
+            path.reverse()
+            self.solution_found = True
+            self.moves = path
+        stats.finish()
+
+    def external_solve(self, current_state, directory=None, ram_budget=256 << 20):
+        # Breadth-first search with its layers on disk (see DiskLayers), for boards whose visited set does
+        # not fit in memory. ram_budget (bytes) sizes the expansion chunks and the buckets each layer is
+        # merged in. The files are written to a temporary folder inside directory (the system temporary
+        # folder by default) and removed at the end.
+        import shutil
+        import tempfile
+        from disk_layers import DiskLayers
+        from layer_search import LayerBoard
+
+        board = LayerBoard(self.tube_numbers, self.ws_game.NColorInTube, self.canonical)
+        stats = self.stats
+        folder = tempfile.mkdtemp(prefix="watersort-", dir=directory)
+        layers = DiskLayers(folder, board, ram_budget)
+        try:
+            start = board.layer(current_state)
+            layers.add_start(start)
+            found = 0 if board.solved(start)[0] else -1
+            # A chunk, its children and their keys, with room for the temporary arrays of expand()
+            rows = max(1, ram_budget // (8 * board.tube_numbers * start.shape[1]))
+            visited = 1
+            while found < 0 and not self.cancelled:
+                depth = len(layers) - 1
+                size = layers.layer_size(depth)
+                if not size:
+                    break
+                expanded = generated = 0
+                for offset, states in layers.chunks(depth, rows):
+                    if self.cancelled:
+                        break
+                    t0 = perf_counter()
+                    children, parent, moves = board.expand(states)
+                    t1 = perf_counter()
+                    layers.spill(children, parent + offset, moves)
+                    t2 = perf_counter()
+                    expanded += len(states)
+                    generated += len(children)
+                    stats.nodes_generated += len(children)
+                    stats.expansion_time += t1 - t0
+                    stats.hashing_time += t2 - t1
+                    stats.expanded(size - expanded + generated, visited, t2, len(states))
+                if self.cancelled:
+                    break
+                t0 = perf_counter()
+                found = layers.close_layer()
+                stats.hashing_time += perf_counter() - t0
+                visited += layers.layer_size(depth + 1)
+                stats.duplicate_hits += generated - layers.layer_size(depth + 1)
+            if found >= 0:
+                self.solution_found = True
+                self.moves = layers.path(len(layers) - 1, found)
+        finally:
+            layers.close()
+            shutil.rmtree(folder, ignore_errors=True)
+        stats.finish()
+
+    def best_first_solve(self, current_state, weight=1.0, seed=None):
+        # Weighted A* (f = cost + weight * heuristic); a seed shuffles the order of equal-f states
+        self._prepare_heuristic(current_state)
+        path = self._weighted_search(self.board.pack(current_state), weight, seed)
+        if path is not None:
+            self.solution_found = True
+            self.moves = path
+        self.stats.finish()
+
+    def anytime_solve(self, current_state, deadline=None, on_solution=None, weights=ANYTIME_WEIGHTS):
+        # A quick first solution from a nearly greedy search, then weighted A* runs with falling weights.
+        # Each run only keeps states that can still beat the best solution so far (cost + heuristic below
+        # its length). Every shorter solution is stored in moves and passed to on_solution. The search
+        # stops at the deadline (a time.perf_counter() value), after the last weight, or once a solution
+        # is as short as the heuristic of the start board.
+        self._prepare_heuristic(current_state)
+        start = self.board.pack(current_state)
+        lower_bound = self.heuristic(start)
+        for weight in weights:
+            if self.cancelled or (deadline is not None and perf_counter() >= deadline):
+                break
+            bound = len(self.moves) if self.solution_found else float('inf')
+            path = self._weighted_search(start, weight, None, bound, deadline)
+            if path is not None:
                 self.solution_found = True
                 self.moves = path
-                return
-            
-            for next_state, move in get_next_states(state):
-                state_tuple = tuple(tuple(tube) for tube in next_state)
-                if state_tuple not in self.visited_tubes:
-                    self.visited_tubes.add(state_tuple)
-                    queue.append((next_state, path + [move]))
-
-    def optimal_solve(self, current_state):
+                if on_solution is not None:
+                    on_solution(list(path))
+                if len(path) <= lower_bound:
+                    break
+        self.stats.finish()
+
+    def _weighted_search(self, start, weight, seed=None, bound=float('inf'), deadline=None):
+        # One weighted A* run from a packed state; children whose cost + heuristic reaches the bound are
+        # dropped. Returns the moves of the first solution found, or None.
         import heapq
+        import random
+        from itertools import count
+
+        board = self.board
+        stats = self.stats
+        self.visited_tubes = visited = {}
+        tie = random.Random(seed).random if seed is not None else count().__next__
+        pq = [(weight * self.heuristic(start), tie(), 0, start)]
+        visited[self._key(start)] = (None, None)
 
-        def is_solved(state):
-            return all(len(set(tube)) <= 1 for tube in state if tube)
-        
-        def get_next_states(state):
-            next_states = []
-            for i in range(self.tube_numbers):
-                for j in range(self.tube_numbers):
-                    if i != j and state[i] and (not state[j] or state[i][-1] == state[j][-1]):
-                        if len(state[j]) < self.ws_game.tube_capacity:
-                            new_state = [tube[:] for tube in state]
-                            new_state[j].append(new_state[i].pop())
-                            next_states.append((new_state, (i, j)))
-            return next_states
-
-        def heuristic(state):
-            return sum(len(set(tube)) - 1 for tube in state if tube)  # heuristic function
-
-        pq = [(heuristic(current_state), 0, current_state, [])]
-        self.visited_tubes.add(tuple(tuple(tube) for tube in current_state))
-
-        while pq:
-            _, cost, state, path = heapq.heappop(pq)
-            
-            if is_solved(state):
+        while pq and not self.cancelled:
+            _, _, cost, state = heapq.heappop(pq)
+
+            if board.is_solved(state):
+                return self._build_path(state)
+
+            t0 = perf_counter()
+            children = board.next_states(state)
+            t1 = perf_counter()
+            fresh = []
+            for next_state, move in children:
+                key = self._key(next_state)
+                if key not in visited:
+                    visited[key] = (state, move)
+                    fresh.append(next_state)
+            t2 = perf_counter()
+            for next_state in fresh:
+                h = self.heuristic(next_state)
+                if cost + 1 + h < bound:
+                    heapq.heappush(pq, (cost + 1 + weight * h, tie(), cost + 1, next_state))
+            t3 = perf_counter()
+            stats.nodes_generated += len(children)
+            stats.duplicate_hits += len(children) - len(fresh)
+            stats.expansion_time += t1 - t0
+            stats.hashing_time += t2 - t1
+            stats.heuristic_time += t3 - t2
+            stats.expanded(len(pq), len(visited), t3)
+            if deadline is not None and t3 >= deadline:
+                break
+        return None
+
+    def parallel_solve(self, current_state, workers=None):
+        # Portfolio search: every worker runs best_first_solve with its own weight and tie-break seed,
+        # and the first worker that finds a solution wins; the pool is terminated on exit.
+        from multiprocessing import Pool, TimeoutError
+
+        workers = workers or os.cpu_count() or 1
+        config = SimpleNamespace(NColor=self.ws_game.NColor, NEmptyTubes=self.ws_game.NEmptyTubes,
+                                 NColorInTube=self.ws_game.NColorInTube)
+        tube_colors = [list(tube) for tube in current_state]
+        jobs = [(config, tube_colors, PORTFOLIO_WEIGHTS[k % len(PORTFOLIO_WEIGHTS)], k, self.pattern_db)
+                for k in range(workers)]
+        with Pool(workers) as pool:
+            results = pool.imap_unordered(_portfolio_search, jobs)
+            for _ in jobs:
+                # Poll so that cancel() can stop the wait; leaving the block terminates the workers
+                while not self.cancelled:
+                    try:
+                        solution_found, moves, worker_stats = results.next(timeout=0.1)
+                        break
+                    except TimeoutError:
+                        pass
+                else:
+                    break
+                self.stats.merge(worker_stats)
+                if solution_found:
+                    self.solution_found = True
+                    self.moves = moves
+                    break
+        self.stats.finish()
+
+    def _prepare_heuristic(self, current_state):
+        # Choose the color groups of the pattern database once per search, from the starting board
+        if self.pattern_db is not None:
+            self._splits = self.pattern_db.splits(self.ws_game.NColor, current_state)
+
+    def heuristic(self, state):
+        # With a pattern database: the additive cost of the color groups, which is never below the
+        # run count estimate. Without: a pour merges at most one run into another and a solved board
+        # has one run per color, so the number of extra runs never overestimates the moves left.
+        if self._splits is not None:
+            return self.pattern_db.heuristic(self.board.tubes(state), self._splits)
+        return self.board.run_count(state) - self.ws_game.NColor
+
+    def optimal_solve(self, current_state, table_size=100000):
+        # IDA*: repeated depth-first searches with a growing bound on moves + heuristic.
+        # Memory is the current path plus a transposition table capped at table_size entries.
+        board = self.board
+        stats = self.stats
+        self._prepare_heuristic(current_state)
+        start = board.pack(current_state)
+        path = []
+        table = {}  # state key -> fewest moves it was reached with in this iteration
+        found = -1
+
+        def search(state, cost, bound):
+            if board.is_solved(state):
+                return found
+            if self.cancelled:
+                return float('inf')
+            t0 = perf_counter()
+            key = self._key(state)
+            seen = table.get(key)
+            if seen is not None and seen <= cost:
+                stats.duplicate_hits += 1
+                stats.hashing_time += perf_counter() - t0
+                return float('inf')
+            if seen is None and len(table) >= table_size:
+                del table[next(iter(table))]  # drop the oldest entry
+            table[key] = cost
+            t1 = perf_counter()
+            next_states = board.next_states(state)
+            t2 = perf_counter()
+            children = [(self.heuristic(child), child, move) for child, move in next_states]
+            t3 = perf_counter()
+            stats.nodes_generated += len(children)
+            stats.hashing_time += t1 - t0
+            stats.expansion_time += t2 - t1
+            stats.heuristic_time += t3 - t2
+            # The frontier of a depth-first search is the current path
+            stats.expanded(len(path), len(table), t3)
+            children.sort(key=lambda item: item[0])
+            next_bound = float('inf')
+            for h, child, move in children:
+                f = cost + 1 + h
+                if f > bound:
+                    next_bound = min(next_bound, f)
+                    continue
+                path.append(move)
+                t = search(child, cost + 1, bound)
+                if t == found:
+                    return found
+                path.pop()
+                next_bound = min(next_bound, t)
+            return next_bound
+
+        bound = self.heuristic(start)
+        while bound != float('inf') and not self.cancelled:
+            table.clear()
+            bound = search(start, 0, bound)
+            if bound == found:
                 self.solution_found = True
                 self.moves = path
-                return
-            
-            for next_state, move in get_next_states(state):
-                state_tuple = tuple(tuple(tube) for tube in next_state)
-                if state_tuple not in self.visited_tubes:
-                    self.visited_tubes.add(state_tuple)
-                    heapq.heappush(pq, (cost + 1 + heuristic(next_state), cost + 1, next_state, path + [move]))
+                break
+        stats.finish()
@@ -0,0 +1,237 @@
+# Headless batch solver: python batch_solve.py boards.jsonl --output results.jsonl
+# Input is JSON lines ({"id": ..., "tubes": [[...], ...], "colors_in_tube": 4}) or a puzzle_generator.py pack.
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+from multiprocessing import Pool
+from time import perf_counter
+from types import SimpleNamespace
+from ai_solution import GameSolution
+from pattern_db import find_pattern_db
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# parallel_solve is left out: pool workers cannot start pools of their own
+METHODS = ("solve", "layer_solve", "external_solve", "optimal_solve", "best_first_solve", "anytime_solve")
+# Share of the timeout the searches get before they stop themselves; the alarm only fires at the end of
+# the timeout, so a search that stops on time keeps its best solution
+SEARCH_SHARE = 0.9
+# puzzle_generator.PACK_MAGIC, repeated so that telling the input apart does not import numpy
+PACK_MAGIC = b"WSPZ"
+# Seconds between two checks for boards whose worker died without a result
+LOST_CHECK_INTERVAL = 1.0
+
+_started = None  # in pool workers, the queue that gets (pid, id) of every board a worker starts
+
+
+class JobTimeout(Exception):
+    """Raised in a worker by the alarm set for the deadline of its board."""
+
+
+def raise_timeout(signum, frame):
+    raise JobTimeout
+
+
+def read_jsonl(path):
+    """Yield (id, tubes, colors in tube) for every board of a JSON lines file, one line at a time.
+        A missing ``id`` is replaced by the line number and a missing ``colors_in_tube`` by the
+        length of the fullest tube.
+    """
+    with open(path) as boards:
+        for number, line in enumerate(boards):
+            if not line.strip():
+                continue
+            board = json.loads(line)
+            tubes = board["tubes"]
+            yield board.get("id", number), tubes, board.get("colors_in_tube", max(map(len, tubes)))
+
+
+def read_pack(path):
+    """Yield (id, tubes, colors in tube) for every board of a pack file; the id is the record index."""
+    from puzzle_generator import PuzzlePack  # needs numpy, only for pack input
+
+    pack = PuzzlePack(path)
+    for index in range(len(pack)):
+        yield index, pack.board(index), pack.colors_in_tube
+
+
+def read_boards(path):
+    """Read a pack file if it starts with the pack header, JSON lines otherwise."""
+    with open(path, "rb") as boards:
+        is_pack = boards.read(len(PACK_MAGIC)) == PACK_MAGIC
+    return read_pack(path) if is_pack else read_jsonl(path)
+
+
+def finished_ids(path):
+    """Return the ids already in a results file, dropping a last line cut off by an interruption."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as results:
+        data = results.read()
+        if data and not data.endswith(b"\n"):
+            results.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    return {json.loads(line)["id"] for line in data.splitlines() if line.strip()}
+
+
+def limit_memory(megabytes):
+    """Pool initializer: cap the address space of the worker, so a search that outgrows it fails alone."""
+    if megabytes and resource is not None:
+        cap = megabytes << 20
+        resource.setrlimit(resource.RLIMIT_AS, (cap, cap))
+
+
+def init_worker(megabytes, started):
+    """Pool initializer: cap the worker's memory and keep the queue it reports the boards it starts on."""
+    global _started
+    _started = started
+    limit_memory(megabytes)
+
+
+def solve_board(job):
+    """Solve one board in a pool worker.
+        The searches check a deadline at ``SEARCH_SHARE`` of the timeout in their progress callback.
+        An alarm at the full timeout (where the platform has one) also stops a search between two
+        steps that do not report progress, such as the merge of a large layer; a single long NumPy
+        call still runs to its end first. A solution found before either stop is kept.
+            Args:
+                job (tuple): (id, tubes, colors in tube, method, timeout in seconds, use pattern database).
+
+            Returns:
+                dict: The id, status (solved, unsolvable, timeout, memory), moves, length, seconds and nodes.
+    """
+    puzzle_id, tubes, colors_in_tube, method, timeout, use_pattern_db = job
+    if _started is not None:
+        _started.put((os.getpid(), puzzle_id))
+    colors = len({color for tube in tubes for color in tube})
+    config = SimpleNamespace(NColor=colors, NEmptyTubes=len(tubes) - colors, NColorInTube=colors_in_tube)
+    start = perf_counter()
+    deadline = start + timeout * SEARCH_SHARE
+
+    def stop_at_deadline(stats):
+        if perf_counter() >= deadline:
+            solution.cancel()
+
+    pattern_db = find_pattern_db(colors_in_tube, len(tubes)) if use_pattern_db else None
+    solution = GameSolution(config, progress=stop_at_deadline, progress_interval=0.05, pattern_db=pattern_db)
+    options = dict(deadline=deadline) if method == "anytime_solve" else {}
+    alarm = hasattr(signal, "setitimer")
+    if alarm:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            getattr(solution, method)(tubes, **options)
+        finally:
+            if alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        if solution.solution_found:
+            status = "solved"
+        else:
+            # anytime_solve stops at its deadline without being cancelled
+            status = "timeout" if solution.cancelled or perf_counter() >= deadline else "unsolvable"
+    except JobTimeout:
+        status = "solved" if solution.solution_found else "timeout"
+    except MemoryError:
+        status = "memory"
+    found = status == "solved"
+    return dict(id=puzzle_id, status=status, moves=solution.moves if found else None,
+                length=len(solution.moves) if found else None, seconds=round(perf_counter() - start, 6),
+                nodes=solution.stats.nodes_expanded)
+
+
+def batch_solve(boards, output, method="optimal_solve", timeout=60.0, memory_mb=None, workers=None,
+                use_pattern_db=False, window=256):
+    """Solve a stream of boards on a process pool and append each result as soon as it is known.
+            Args:
+                boards (Iterable[tuple]): (id, tubes, colors in tube) of every board.
+                output (str): The JSON lines results file; boards whose id is in it already are skipped.
+                method (str): The GameSolution search to run.
+                timeout (float): Seconds after which a search is stopped.
+                memory_mb (int): The address space limit of every worker, None for no limit.
+                workers (int): The number of worker processes, all cores by default.
+                use_pattern_db (bool): Use the pattern databases built for each board configuration.
+                window (int): The most boards handed to the pool and not finished yet.
+                    A board whose worker dies without a result (killed by the kernel, say) is written
+                    with the status ``error``.
+
+            Returns:
+                int: The number of boards solved in this run.
+    """
+    done = finished_ids(output)
+    jobs = ((puzzle_id, tubes, colors_in_tube, method, timeout, use_pattern_db)
+            for puzzle_id, tubes, colors_in_tube in boards if puzzle_id not in done)
+    finished = queue.SimpleQueue()
+    started = multiprocessing.SimpleQueue()
+    in_flight = {}  # id -> AsyncResult of every board handed to the pool and not written yet
+    working = {}  # worker pid -> id of the board it started last
+    solved = 0
+    with open(output, "a") as results, Pool(workers, initializer=init_worker, initargs=(memory_mb, started)) as pool:
+
+        def next_result():
+            # A worker that is killed never calls back, so while waiting, the boards of the workers
+            # that are gone are looked for; the pool starts new workers in their place
+            while True:
+                try:
+                    return finished.get(timeout=LOST_CHECK_INTERVAL)
+                except queue.Empty:
+                    pass
+                while not started.empty():
+                    pid, puzzle_id = started.get()
+                    working[pid] = puzzle_id
+                alive = {process.pid for process in multiprocessing.active_children()}
+                for pid in [pid for pid in working if pid not in alive]:
+                    puzzle_id = working.pop(pid)
+                    if puzzle_id in in_flight and not in_flight[puzzle_id].ready():
+                        return dict(id=puzzle_id, status="error", moves=None, length=None, seconds=None,
+                                    nodes=None)
+
+        def write_result():
+            nonlocal solved
+            result = next_result()
+            if isinstance(result, BaseException):
+                raise result
+            in_flight.pop(result["id"], None)
+            results.write(json.dumps(result) + "\n")
+            results.flush()
+            solved += result["status"] == "solved"
+
+        # A new board is handed to the pool whenever one finishes, so a slow board never holds up the
+        # others and the input is only read window boards ahead
+        running = 0
+        for job in jobs:
+            while running == window or not finished.empty():
+                write_result()
+                running -= 1
+            in_flight[job[0]] = pool.apply_async(solve_board, (job,), callback=finished.put,
+                                                 error_callback=finished.put)
+            running += 1
+        for _ in range(running):
+            write_result()
+    return solved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve water sort boards offline on a process pool.")
+    parser.add_argument("boards", help="JSON lines file or puzzle pack")
+    parser.add_argument("--output", required=True, help="JSON lines results file, resumed if it exists")
+    parser.add_argument("--method", default="optimal_solve", choices=METHODS)
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds per board; a single long NumPy step is finished before the search stops")
+    parser.add_argument("--memory-mb", type=int, default=None, help="address space limit per worker")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--pattern-db", action="store_true", help="use the tables built by pattern_db.py")
+    args = parser.parse_args(argv)
+    solved = batch_solve(read_boards(args.boards), args.output, args.method, args.timeout, args.memory_mb,
+                         args.workers, args.pattern_db)
+    print(f"solved {solved} boards, results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
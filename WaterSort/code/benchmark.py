@@ -0,0 +1,131 @@
+# Reproducible solver benchmark: python benchmark.py --colors 4 6 8 --output results.jsonl
+# or, on certified boards of a pack: python benchmark.py --puzzles six.wsp --limit 20
+import argparse
+import itertools
+import json
+import multiprocessing
+import queue
+import sys
+import time
+from ai_solution import GameSolution
+from engine import WaterSortEngine
+from pattern_db import find_pattern_db
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+MODES = ("solve", "layer_solve", "external_solve", "optimal_solve", "best_first_solve", "anytime_solve", "parallel_solve")
+
+
+def peak_rss_kb():
+    """Return the peak resident set size of this process in KiB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes
+
+
+def run_case(case):
+    """Generate the board of a benchmark case, solve it with the requested mode and collect its SearchStats.
+            Args:
+                case (dict): The colors, empty_tubes, colors_in_tube, seed and mode of the case, or the
+                    puzzles pack, index and mode of a case taken from a pack, and whether to use the
+                    pattern database of the configuration.
+
+            Returns:
+                dict: The case extended with the measurements.
+    """
+    if "puzzles" in case:
+        from puzzle_generator import PuzzlePack  # needs numpy, only for pack runs
+        pack = PuzzlePack(case["puzzles"])
+        engine = WaterSortEngine(pack.colors, pack.colors_in_tube, pack.empty_tubes)
+        engine.tube_colors = pack.board(case["index"])
+    else:
+        engine = WaterSortEngine(case["colors"], case["colors_in_tube"], case["empty_tubes"], seed=case["seed"])
+        engine.new_board()
+    pattern_db = None
+    if case["pattern_db"]:
+        pattern_db = find_pattern_db(engine.NColorInTube, engine.NColor + engine.NEmptyTubes)
+    solution = GameSolution(engine, pattern_db=pattern_db)
+    start = time.perf_counter()
+    getattr(solution, case["mode"])(engine.tube_colors)
+    elapsed = time.perf_counter() - start
+    measured = dict(case, solved=solution.solution_found, timed_out=False, seconds=round(elapsed, 6),
+                    solution_length=len(solution.moves) if solution.solution_found else None,
+                    peak_rss_kb=peak_rss_kb())
+    measured.update(solution.stats.as_dict())
+    return measured
+
+
+def _case_process(case, results):
+    results.put(run_case(case))
+
+
+def measure(case, timeout):
+    """Run one case in a fresh process, so its peak RSS is not shared with other cases.
+            Args:
+                case (dict): The benchmark case.
+                timeout (float): The number of seconds after which the case is stopped.
+
+            Returns:
+                dict: The measurements, with ``timed_out`` set if the case was stopped, or ``exitcode``
+                    set to the worker's exit status (negative for a signal) if it died without a result.
+    """
+    results = multiprocessing.Queue()
+    # Not a Pool worker: pool processes are daemonic and parallel_solve needs to start its own pool
+    process = multiprocessing.Process(target=_case_process, args=(case, results))
+    start = time.perf_counter()
+    process.start()
+    # The result is a small dict, so the worker never blocks on the queue and exits as soon as it is done
+    process.join(timeout)
+    seconds = round(time.perf_counter() - start, 6)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return dict(case, solved=False, timed_out=True, seconds=seconds, solution_length=None, peak_rss_kb=None)
+    if process.exitcode == 0:
+        try:
+            return results.get(timeout=1.0)
+        except queue.Empty:  # exited cleanly without reporting, treated as a crash
+            pass
+    return dict(case, solved=False, timed_out=False, seconds=seconds, solution_length=None, peak_rss_kb=None,
+                exitcode=process.exitcode)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the water sort solvers on seeded boards.")
+    parser.add_argument("--colors", type=int, nargs="+", default=[4, 6, 8], help="values of NColor")
+    parser.add_argument("--empty-tubes", type=int, nargs="+", default=[2], help="values of NEmptyTubes")
+    parser.add_argument("--colors-in-tube", type=int, nargs="+", default=[4], help="values of CTube")
+    parser.add_argument("--seeds", type=int, default=3, help="boards per configuration, seeded 0..N-1")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per case")
+    parser.add_argument("--output", default="-", help="JSON lines file, '-' for stdout")
+    parser.add_argument("--puzzles", help="pack file to take the boards from instead of seeded boards")
+    parser.add_argument("--limit", type=int, default=10, help="boards taken from the pack")
+    parser.add_argument("--pattern-db", action="store_true", help="use the tables built by pattern_db.py")
+    args = parser.parse_args(argv)
+
+    if args.puzzles:
+        cases = (dict(puzzles=args.puzzles, index=index, mode=mode, pattern_db=args.pattern_db)
+                 for index, mode in itertools.product(range(args.limit), args.modes))
+    else:
+        cases = (dict(colors=colors, empty_tubes=empty_tubes, colors_in_tube=colors_in_tube, seed=seed, mode=mode,
+                      pattern_db=args.pattern_db)
+                 for colors, empty_tubes, colors_in_tube, seed, mode in itertools.product(
+                     args.colors, args.empty_tubes, args.colors_in_tube, range(args.seeds), args.modes))
+
+    out = sys.stdout if args.output == "-" else open(args.output, "a")
+    try:
+        for case in cases:
+            out.write(json.dumps(measure(case, args.timeout)) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# BFS layers kept on disk for searches larger than memory
+import os
+import numpy as np
+
+# Bytes held in memory while a bucket is merged, per spilled byte: the rows, the sort and the copies it keeps
+MERGE_OVERHEAD = 3
+
+
+class DiskLayers:
+    """The layers of a breadth-first search stored as memory-mapped files, with delayed duplicate detection.
+
+        Children are first appended unchecked to one spill file per layer. When the layer is complete,
+        the spill is split into as many buckets as needed for one bucket to be merged within the RAM
+        budget. Each bucket is loaded on its own, sorted by key, deduplicated and merged against the
+        sorted keys of the matching buckets of all earlier layers, which are only read through memory
+        maps. A layer with ``2 ** bits`` buckets puts a state into the bucket given by the top ``bits``
+        bits of the hash of its key (``LayerBoard.keys``), so a bucket of one layer covers whole buckets
+        of the layers with fewer bits and lies inside a single bucket of the layers with more.
+
+        Files of layer ``d`` and bucket ``b`` (``.npy``, memory-mapped when read):
+            ``d{d}_b{b}_keys``: the sorted keys,
+            ``d{d}_b{b}_states``: the packed states in key order,
+            ``d{d}_b{b}_parents``: the index of each state's parent in layer ``d - 1``,
+            ``d{d}_b{b}_moves``: the (src, dst) move from the parent.
+        A state's index in a layer counts the states of all lower buckets first. Empty buckets have
+        no files.
+
+        Attributes:
+            directory (str): The folder holding the files.
+            board (LayerBoard): The vectorized move rules.
+            ram_budget (int): The bytes a bucket merge or a spill partition chunk may use.
+            sizes (List[np.ndarray]): The number of states of every bucket of every layer.
+    """
+    def __init__(self, directory, board, ram_budget):
+        self.directory = directory
+        self.board = board
+        self.ram_budget = ram_budget
+        self.sizes = []
+        self._spill = None  # the spill file of the layer being built, open until close_layer
+        self._key_offsets = {}  # (depth, bucket) -> bytes before the data of the stored keys file
+        width = board.tube_numbers * board.width
+        self._record = np.dtype([("key", f"V{width}"), ("state", np.uint8, width), ("parent", np.int64),
+                                 ("move", np.uint8, 2)])
+        self._multipliers = np.random.default_rng(1).integers(1, 2 ** 63, width, dtype=np.uint64) | 1
+
+    def _path(self, depth, bucket, name):
+        return os.path.join(self.directory, f"d{depth}_b{bucket}_{name}.npy")
+
+    def _spill_path(self, name):
+        return os.path.join(self.directory, f"spill_{name}.bin")
+
+    def _hash(self, keys):
+        keys = np.ascontiguousarray(keys)  # a field of the spill records is strided
+        rows = keys.view(np.uint8).reshape(len(keys), keys.dtype.itemsize).astype(np.uint64)
+        return (rows * self._multipliers).sum(axis=1, dtype=np.uint64)
+
+    @staticmethod
+    def _bucket_of(hashes, bits):
+        if not bits:
+            return np.zeros(len(hashes), dtype=np.int64)
+        return (hashes >> np.uint64(64 - bits)).astype(np.int64)
+
+    def _bits(self, depth):
+        return int(len(self.sizes[depth])).bit_length() - 1
+
+    def load(self, depth, bucket, name):
+        """Return a read-only memory map of one file of a stored layer."""
+        return np.load(self._path(depth, bucket, name), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def layer_size(self, depth):
+        return int(self.sizes[depth].sum())
+
+    def spill(self, states, parents, moves):
+        """Append children of the layer being built to its spill file."""
+        records = np.empty(len(states), dtype=self._record)
+        records["key"] = self.board.keys(states)
+        records["state"] = states
+        records["parent"] = parents
+        records["move"] = moves
+        if self._spill is None:
+            self._spill = open(self._spill_path("layer"), "wb")
+        records.tofile(self._spill)
+
+    def close(self):
+        """Close the spill file of an unfinished layer."""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def close_layer(self):
+        """Deduplicate the spilled children and store them as the next layer.
+                Returns:
+                    int: The index of a solved state in the new layer, or -1.
+        """
+        depth = len(self.sizes)
+        spilled = self._spill.tell() if self._spill is not None else 0
+        self.close()
+        # The fewest buckets, a power of two, that fill half the budget on average: the hash does not
+        # split the states evenly, so the larger buckets still fit
+        bits = max(0, int(np.ceil(np.log2(max(1, 2 * MERGE_OVERHEAD * spilled / self.ram_budget)))))
+        sizes = np.zeros(1 << bits, dtype=np.int64)
+        solved = -1
+        for bucket, records in self._buckets(bits, spilled):
+            keys, first = np.unique(records["key"], return_index=True)
+            fresh = np.ones(len(keys), dtype=bool)
+            for earlier in range(depth):
+                for seen in self._seen_keys(earlier, bits, bucket):
+                    if not len(keys):
+                        break
+                    position = np.searchsorted(seen, keys)
+                    inside = position < len(seen)
+                    fresh[inside] &= seen[position[inside]] != keys[inside]
+            kept = records[first[fresh]]
+            self._store(depth, bucket, keys[fresh], kept["state"], kept["parent"], kept["move"])
+            sizes[bucket] = len(kept)
+            if solved < 0 and len(kept):
+                done = self.board.solved(kept["state"])
+                if done.any():
+                    solved = int(sizes[:bucket].sum() + done.argmax())
+        self.sizes.append(sizes)
+        return solved
+
+    def _buckets(self, bits, spilled):
+        """Yield (bucket, records) of the spilled children, one loaded bucket at a time."""
+        path = self._spill_path("layer")
+        if not spilled:
+            return
+        if not bits:
+            records = np.fromfile(path, dtype=self._record)
+            os.remove(path)
+            yield 0, records
+            return
+        # Rewrite the spill a budget-sized chunk at a time, each chunk ordered by bucket, into one runs
+        # file: a bucket is then gathered from its slice of every chunk, with two files open at most.
+        spill = np.memmap(path, dtype=self._record, mode="r")
+        rows = max(1, self.ram_budget // (MERGE_OVERHEAD * self._record.itemsize))
+        runs_path = self._spill_path("runs")
+        bounds = []  # per chunk, the first row of every bucket in the runs file
+        try:
+            with open(runs_path, "wb") as runs:
+                for start in range(0, len(spill), rows):
+                    chunk = np.array(spill[start:start + rows])
+                    buckets = self._bucket_of(self._hash(chunk["key"]), bits)
+                    order = np.argsort(buckets, kind="stable")
+                    chunk[order].tofile(runs)
+                    bounds.append(start + np.searchsorted(buckets[order], np.arange((1 << bits) + 1)))
+        finally:
+            del spill
+        os.remove(path)
+        bounds = np.array(bounds)
+        runs = np.memmap(runs_path, dtype=self._record, mode="r")
+        try:
+            for bucket in range(1 << bits):
+                first, counts = bounds[:, bucket], bounds[:, bucket + 1] - bounds[:, bucket]
+                total = int(counts.sum())
+                if not total:
+                    continue
+                # The row numbers of the bucket's slices, one after another
+                rows_of = np.repeat(first - (np.cumsum(counts) - counts), counts) + np.arange(total)
+                yield bucket, runs[rows_of]
+        finally:
+            del runs
+            os.remove(runs_path)
+
+    def _seen_keys(self, depth, bits, bucket):
+        """Yield the stored key arrays of layer ``depth`` that can hold keys of ``bucket`` of a ``bits`` layer.
+
+            Each array is a memory map opened for this merge only and released when the next one is read,
+            so the open files stay the same however many layers and buckets are stored.
+        """
+        earlier_bits = self._bits(depth)
+        if earlier_bits <= bits:
+            candidates = [bucket >> (bits - earlier_bits)]
+        else:
+            shift = earlier_bits - bits
+            candidates = range(bucket << shift, (bucket + 1) << shift)
+        for candidate in candidates:
+            if not self.sizes[depth][candidate]:
+                continue
+            # Mapped past the header saved by _store rather than through np.load, which parses it again
+            seen = np.memmap(self._path(depth, candidate, "keys"), dtype=self._record["key"], mode="r",
+                             offset=self._key_offsets[depth, candidate], shape=(int(self.sizes[depth][candidate]),))
+            yield seen
+            del seen
+
+    def add_start(self, layer):
+        """Store the one-state start layer."""
+        keys = self.board.keys(layer)
+        self._store(0, 0, keys, layer, np.full(1, -1, dtype=np.int64), np.zeros((1, 2), dtype=np.uint8))
+        self.sizes.append(np.ones(1, dtype=np.int64))
+
+    def _store(self, depth, bucket, keys, states, parents, moves):
+        if not len(keys):
+            return
+        for name, values in (("keys", keys), ("states", states), ("parents", parents), ("moves", moves)):
+            np.save(self._path(depth, bucket, name), values)
+        self._key_offsets[depth, bucket] = os.path.getsize(self._path(depth, bucket, "keys")) - keys.nbytes
+
+    def chunks(self, depth, rows):
+        """Yield (first index, states) of a stored layer in chunks of ``rows`` states, the last one shorter."""
+        offset = 0
+        pieces, pending = [], 0
+        for bucket in np.flatnonzero(self.sizes[depth]).tolist():
+            states = self.load(depth, bucket, "states")
+            start = 0
+            while start < len(states):
+                piece = states[start:start + rows - pending]
+                pieces.append(piece)
+                pending += len(piece)
+                start += len(piece)
+                if pending == rows:
+                    yield offset, np.concatenate(pieces)
+                    offset += pending
+                    pieces, pending = [], 0
+        if pending:
+            yield offset, np.concatenate(pieces)
+
+    def path(self, depth, index):
+        """Return the moves from the start to state ``index`` of layer ``depth``."""
+        moves = []
+        while depth > 0:
+            ends = np.cumsum(self.sizes[depth])
+            bucket = int(np.searchsorted(ends, index, side="right"))
+            local = index - (int(ends[bucket - 1]) if bucket else 0)
+            move = self.load(depth, bucket, "moves")[local]
+            moves.append((int(move[0]), int(move[1])))
+            index = int(self.load(depth, bucket, "parents")[local])
+            depth -= 1
+        moves.reverse()
+        return moves
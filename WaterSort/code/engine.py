@@ -0,0 +1,135 @@
+# Headless water sort core: board generation, moves and victory, without pygame
+import copy
+import random
+from move_history import MoveHistory, apply_pour
+from moves import pour_amount
+
+
+class WaterSortEngine:
+    """The game rules and board state, usable without a display.
+
+        Attributes:
+            NColorInTube (int): The maximum number of colors in a single tube.
+            NEmptyTubes (int): The number of initially empty tubes.
+            NColor (int): The number of unique colors available in the game.
+            rng (random.Random): The random generator used for new boards; seed it for reproducible boards.
+            tubes (int): The total number of tubes in the game.
+            tube_colors (list): The colors in each tube.
+            initial_colors (list): The colors in each tube when the board was generated.
+            history (MoveHistory): The moves made on the board, for undo, redo and replays.
+            win (bool): True if the player has won the game.
+            puzzle_pack (PuzzlePack): Optional pack of certified boards used instead of random ones
+                when its settings match the current ones.
+    """
+    def __init__(self, colors=3, colors_in_tube=2, empty_tubes=1, seed=None):
+        self.NColorInTube = colors_in_tube
+        self.NEmptyTubes = empty_tubes
+        self.NColor = colors
+        self.rng = random.Random(seed)
+        self.tubes = 0
+        self.tube_colors = []
+        self.initial_colors = []
+        self.history = MoveHistory()
+        self.win = False
+        self.puzzle_pack = None
+
+    @property
+    def move_count(self):
+        """The number of moves currently applied to the board."""
+        return self.history.position
+
+    def new_board(self):
+        """Generate a new board with the current settings and clear the move history."""
+        self.tubes, self.tube_colors = self.generate_start()
+        self.initial_colors = copy.deepcopy(self.tube_colors)
+        self.history.clear()
+        self.win = False
+
+    def generate_start(self):
+        """Generate the initial configuration of tubes with colors.
+                Returns:
+                    Tuple[int, List[List[int]]]: A tuple containing the total number of tubes
+                    and a list of lists representing the colors in each tube.
+        """
+        tubes_number = self.NEmptyTubes + self.NColor
+        pack = self.puzzle_pack
+        if pack is not None and (pack.colors, pack.empty_tubes, pack.colors_in_tube) == \
+                (self.NColor, self.NEmptyTubes, self.NColorInTube):
+            return tubes_number, pack.random_board()
+        check_win = True
+        while check_win:
+            # Shuffle every color unit once and cut the result into full tubes
+            available_colors = [color for color in range(self.NColor) for _ in range(self.NColorInTube)]
+            self.rng.shuffle(available_colors)
+            tubes_colors = [available_colors[i * self.NColorInTube:(i + 1) * self.NColorInTube]
+                            for i in range(self.NColor)]
+            tubes_colors += [[] for _ in range(self.NEmptyTubes)]
+            check_win = self.check_victory(tubes_colors)
+        return tubes_number, tubes_colors
+
+    def move_logic(self, tube_cols, sel_tube, dest_tube):
+        """Handle the logic for moving colors between tubes.
+                Args:
+                    tube_cols (List[List[int]]): A list of lists representing the colors in each tube.
+                    sel_tube (int): The index of the selected tube.
+                    dest_tube (int): The index of the destination tube.
+
+                Returns:
+                    List[List[int]]: Updated tube colors after the move.
+        """
+        amount = 0
+        if sel_tube != dest_tube:
+            amount = pour_amount(tube_cols[sel_tube], tube_cols[dest_tube], self.NColorInTube)
+        if amount:
+            self.history.record(sel_tube, dest_tube, amount)
+            apply_pour(tube_cols, sel_tube, dest_tube, amount)
+
+        return tube_cols
+
+    def undo(self):
+        """Take back the last move; returns False if there is none."""
+        return self.history.undo(self.tube_colors)
+
+    def redo(self):
+        """Make the last undone move again; returns False if there is none."""
+        return self.history.redo(self.tube_colors)
+
+    def seek(self, index):
+        """Show the board after move ``index`` of the history, keeping later moves for redo."""
+        self.history.seek(self.tube_colors, index, self.initial_colors)
+
+    def save_replay(self, path):
+        """Write the starting board and every move of the history to a replay file."""
+        self.history.save(path, self.initial_colors, self.NColorInTube)
+
+    def load_replay(self, path):
+        """Load a replay file written by save_replay(), positioned before its first move.
+            The board settings are taken from the replay.
+        """
+        self.history, initial, self.NColorInTube = MoveHistory.load(path)
+        self.NColor = sum(1 for tube in initial if tube)
+        self.NEmptyTubes = len(initial) - self.NColor
+        self.tubes = len(initial)
+        self.initial_colors = initial
+        self.tube_colors = copy.deepcopy(initial)
+        self.win = self.check_victory(self.tube_colors)
+
+    def check_victory(self, tube_cols):
+        """Check if the player has won the game.
+                Args:
+                    tube_cols (List[List[int]]): A list of lists representing the colors in each tube.
+
+                Returns:
+                    bool: True if the player has won, False otherwise.
+        """
+        won = True
+        for i in range(len(tube_cols)):
+            if len(tube_cols[i]) > 0:
+                if len(tube_cols[i]) != self.NColorInTube:
+                    won = False
+                else:
+                    main_color = tube_cols[i][-1]
+                    for j in range(len(tube_cols[i])):
+                        if tube_cols[i][j] != main_color:
+                            won = False
+        return won
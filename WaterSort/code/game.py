@@ -1,13 +1,26 @@
 # water sort! Color sorting game in Python
 import pygame
-import random
 import copy
+import os
+import queue
+import threading
+from time import perf_counter
 from ai_solution import GameSolution
+from engine import WaterSortEngine
+from move_history import apply_pour
+from moves import pour_amount
+from pattern_db import find_pattern_db
+from renderer import Renderer, render_text
+from solution_cache import SolutionCache
 
 # Constants for the game window
 WIDTH = 850
 HEIGHT = 600
 fps = 60
+move_delay = 500  # milliseconds between two moves of an automatic solution
+solve_budget = 3.0  # seconds the Solve button keeps improving its first solution
+cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solutions.sqlite")
+replay_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay.json")
 
 # Color choices available for the game
 color_choices = ['red', 'light blue', 'dark green', 'yellow', 'orange', 'purple', 'pink', 'brown', 'gray',
@@ -24,7 +37,6 @@ class SpinBox:
             value (int): The current value of the SpinBox.
             min_value (int): The minimum allowed value.
             max_value (int): The maximum allowed value.
-            font (pygame.Font): The font used for text rendering.
             increment_button_rect (pygame.Rect): The rectangle for the increment button.
             decrement_button_rect (pygame.Rect): The rectangle for the decrement button.
     """
@@ -36,28 +48,28 @@ class SpinBox:
         self.value = initial_value
         self.min_value = min_value
         self.max_value = max_value
-        self.font = pygame.font.SysFont("Arial", 24)
         self.increment_button_rect = pygame.Rect(x + 30, y - 3, 20, 15)
         self.decrement_button_rect = pygame.Rect(x + 50, y - 3, 20, 15)
 
     def draw(self, display):
-        """Draws the SpinBox widget on the display."""
-        lbl_txt = pygame.font.SysFont("Arial", 20)
-        label_text = lbl_txt.render(f"{self.label}:", True, 'teal')
-        value_text = lbl_txt.render(f"{self.value}", True, 'teal')
-        display.blit(label_text, (self.x - 50, self.y - 7))
-        display.blit(value_text, (self.x - 48 + label_text.get_width(), self.y - 7))
-        pygame.draw.rect(display, 'white', self.increment_button_rect, 2)
-        pygame.draw.rect(display, 'white', self.decrement_button_rect, 2)
+        """Draws the SpinBox widget on the display.
+                Returns:
+                    pygame.Rect: The area covered by the widget.
+        """
+        label_text = render_text(f"{self.label}:", 20, 'teal')
+        value_text = render_text(f"{self.value}", 20, 'teal')
+        area = display.blit(label_text, (self.x - 50, self.y - 7))
+        area.union_ip(display.blit(value_text, (self.x - 48 + label_text.get_width(), self.y - 7)))
 
         # Render the increment and decrement signs
-        increment_sign = self.font.render("+", True, 'green')
-        decrement_sign = self.font.render("-", True, 'red')
-        display.blit(increment_sign, (self.increment_button_rect.x + 5, self.increment_button_rect.y - 7))
-        display.blit(decrement_sign, (self.decrement_button_rect.x + 7, self.decrement_button_rect.y - 9))
+        increment_sign = render_text("+", 24, 'green')
+        decrement_sign = render_text("-", 24, 'red')
+        area.union_ip(display.blit(increment_sign, (self.increment_button_rect.x + 5, self.increment_button_rect.y - 7)))
+        area.union_ip(display.blit(decrement_sign, (self.decrement_button_rect.x + 7, self.decrement_button_rect.y - 9)))
 
-        pygame.draw.rect(display, 'teal', self.increment_button_rect, 2)
-        pygame.draw.rect(display, 'teal', self.decrement_button_rect, 2)
+        area.union_ip(pygame.draw.rect(display, 'teal', self.increment_button_rect, 2))
+        area.union_ip(pygame.draw.rect(display, 'teal', self.decrement_button_rect, 2))
+        return area
 
     def update(self, evt):
         """Updates the SpinBox based on user input event.
@@ -78,31 +90,33 @@ class Button:
             rect (pygame.Rect): The rectangle defining the button's position and size.
             text (str): The text displayed on the button.
             color (tuple): The color of the button.
-            font (pygame.Font): The font used for text rendering.
     """
     def __init__(self, x, y, width, height, text, color):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
         self.color = color
-        self.font = pygame.font.SysFont("Arial", 20)
 
     def draw(self, display):
         """Draws the Button widget on the display.
                 Args:
                     display: The pygame display surface.
+
+                Returns:
+                    pygame.Rect: The area covered by the button.
         """
         pygame.draw.rect(display, self.color, self.rect)
-        text_surface = self.font.render(self.text, True, (255, 255, 255))
+        text_surface = render_text(self.text, 20, (255, 255, 255))
         text_rect = text_surface.get_rect(center=self.rect.center)
         display.blit(text_surface, text_rect)
+        return self.rect
 
 
-class Game:
+class Game(WaterSortEngine):
     """The main class for the Water Sort game.
-        This class manages the game's logic, display, and user interactions.
+        This class manages the game's display and user interactions; the rules and the board
+        state come from WaterSortEngine.
         Attributes:
             clock (pygame.time.Clock): The game clock.
-            font (pygame.Font): The font used for text rendering.
             screen (pygame.Surface): The game window surface.
             tubes (int): The total number of tubes in the game.
             NColorInTube (int): The maximum number of colors in a single tube.
@@ -115,10 +129,9 @@ class Game:
             run (bool): True while the game is running.
             tube_colors (list): The colors in each tube.
             tube_rects (list): Rectangles representing each tube for rendering.
-            game_state_history (list): A history of game states for undo functionality.
+            history (MoveHistory): The moves made on the board, for undo, redo and replays.
             selected (bool): True if a tube is selected for moving colors.
             win (bool): True if the player has won the game.
-            move_count (int): The number of moves made by the player.
             selected_tube (int): The index of the currently selected tube.
             destination_tube (int): The index of the destination tube for moving colors.
             undo_button (Button): The "Undo" button.
@@ -128,29 +141,38 @@ class Game:
             color_spinner (SpinBox): The SpinBox for selecting the number of colors.
             empty_tubes_spinner (SpinBox): The SpinBox for selecting the number of empty tubes.
             colors_in_tube_spinner (SpinBox): The SpinBox for selecting the number of colors in each tube.
+            cancel_button (Button): The "Cancel" button shown while solving or playing a solution.
+            solver (GameSolution): The search running in the background, None when idle.
+            solver_thread (threading.Thread): The worker thread running the search.
+            playback (List[Tuple[int, int]]): The moves of a found solution that are still to be played.
+            solver_start (List[List[int]]): The board the running search started from.
+            solutions (queue.SimpleQueue): Improved solutions handed over by the search thread.
+            next_move_time (int): The pygame tick at which the next playback move is made.
+            solution_cache (SolutionCache): The on-disk store of solved boards shared by all searches.
+            show_stats (bool): True while the search statistics overlay is shown (toggled with <S>).
+            last_stats (SearchStats): The statistics of the running or the last finished search.
+            renderer (Renderer): Redraws only the regions of the screen that changed.
     """
-    def __init__(self):
+    def __init__(self, puzzle_pack=None):
+        if puzzle_pack is None:
+            super().__init__(colors=3, colors_in_tube=2, empty_tubes=1)
+        else:
+            # Start with the settings of the pack so that its boards are used
+            super().__init__(puzzle_pack.colors, puzzle_pack.colors_in_tube, puzzle_pack.empty_tubes)
+            self.puzzle_pack = puzzle_pack
         pygame.init()
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont("Arial", 27)
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        self.renderer = Renderer(self.screen)
+        self.screen_layout = None
         pygame.display.set_caption("Water Sort!")
-        self.tubes = 0
-        self.NColorInTube = 2
-        self.NEmptyTubes = 1
-        self.NColor = 3
         self.color_count = self.NColor
         self.empty_tubes_count = self.NEmptyTubes
         self.colors_in_tube_count = self.NColorInTube
         self.new_game = True
         self.run = True
-        self.tube_colors = []
         self.tube_rects = []
-        self.game_state_history = []
-        self.initial_colors = []
         self.selected = False
-        self.win = False
-        self.move_count = 0
         self.move_text = ""
         self.selected_tube = 100
         self.destination_tube = 100
@@ -162,143 +184,76 @@ class Game:
         self.color_spinner = SpinBox(440, 560, "NColor", self.color_count, 2, 15)
         self.empty_tubes_spinner = SpinBox(590, 560, "ETube", self.empty_tubes_count, 1, 3)
         self.colors_in_tube_spinner = SpinBox(740, 560, "CTube", self.colors_in_tube_count, 2, 20)
+        self.cancel_button = Button(660, 12, 80, 30, "Cancel", (150, 40, 40))
+        self.solver = None
+        self.solver_thread = None
+        self.playback = []
+        self.solver_start = None
+        self.solutions = queue.SimpleQueue()
+        self.next_move_time = 0
+        self.solution_cache = SolutionCache(cache_path)
+        self.show_stats = False
+        self.last_stats = None
+
+    def load_replay(self, path):
+        """Load a replay like WaterSortEngine.load_replay and show its board instead of a new one."""
+        super().load_replay(path)
+        self.color_spinner.value = self.NColor
+        self.empty_tubes_spinner.value = self.NEmptyTubes
+        self.colors_in_tube_spinner.value = self.NColorInTube
+        self.new_game = False
 
     def generate_start(self):
-        """Generate the initial configuration of tubes with colors.
-                Returns:
-                    Tuple[int, List[List[int]]]: A tuple containing the total number of tubes
-                    and a list of lists representing the colors in each tube.
-        """
-        global tubes_number, tubes_colors
-        check_win = True
-        while check_win:
-            tubes_number = self.NEmptyTubes + self.NColor
-            tubes_colors = []
-            available_colors = []
-            for i in range(tubes_number):
-                tubes_colors.append([])
-                if i < tubes_number - self.NEmptyTubes:
-                    for j in range(self.NColorInTube):
-                        available_colors.append(i)
-            for i in range(tubes_number - self.NEmptyTubes):
-                for j in range(self.NColorInTube):
-                    color = random.choice(available_colors)
-                    tubes_colors[i].append(color)
-                    available_colors.remove(color)
-            check_win = self.check_victory(tubes_colors)
-
+        """Generate a new board like WaterSortEngine.generate_start and print it."""
+        tubes_number, tubes_colors = super().generate_start()
         print(tubes_colors, tubes_number)
         return tubes_number, tubes_colors
 
-    def draw_tubes(self, tubes_num, tube_cols):
-        """Draw the tubes and their colors on the game screen.
+    def tube_boxes(self, tubes_num):
+        """Return the rectangle of every tube; the tubes are laid out in two rows.
                 Args:
                     tubes_num (int): The total number of tubes in the game.
-                    tube_cols (List[List[int]]): A list of lists representing the colors in each tube.
 
                 Returns:
-                    List[pygame.Rect]: A list of pygame.Rect objects representing the rectangles
-                    of the drawn tubes for user interaction.
+                    List[pygame.Rect]: The rectangle of each tube, in tube order.
         """
-        tube_boxes = []
-        if tubes_num % 2 == 0:
-            tubes_per_row = tubes_num // 2
-            offset = False
-        else:
-            tubes_per_row = tubes_num // 2 + 1
-            offset = True
+        tubes_per_row = (tubes_num + 1) // 2
         spacing = WIDTH // tubes_per_row
-        color_height = 200 // self.NColorInTube
-        for k in range(tubes_per_row):
-            for j in range(len(tube_cols[k])):
-                pygame.draw.rect(self.screen, color_choices[tube_cols[k][j]],
-                                 (k * spacing + spacing // 4, 250 - (color_height * (j + 1))
-                                  , 65, color_height), 0, 5)
-            box = pygame.draw.rect(self.screen, 'teal', [spacing // 4 + spacing * k, 50, 65, 200], 3, 5)
-            if k == self.selected_tube:
-                pygame.draw.rect(self.screen, 'white', [spacing // 4 + spacing * k, 50, 65, 200], 3, 5)
-            tube_boxes.append(box)
-        if offset:
-            for k in range(tubes_per_row - 1):
-                for j in range(len(tube_cols[k + tubes_per_row])):
-                    pygame.draw.rect(self.screen, color_choices[tube_cols[k + tubes_per_row][j]],
-                                     (k * spacing + spacing // 4,
-                                      500 - (color_height * (j + 1))
-                                      , 65, color_height), 0, 5)
-                box = pygame.draw.rect(self.screen, 'teal', [spacing // 4 + spacing * k, 300, 65, 200], 3, 5)
-                if self.selected_tube == k + tubes_per_row:
-                    pygame.draw.rect(self.screen, 'white', [spacing // 4 + spacing * k, 300, 65, 200], 3, 5)
-                tube_boxes.append(box)
-        else:
-            for k in range(tubes_per_row):
-                for j in range(len(tube_cols[k + tubes_per_row])):
-                    pygame.draw.rect(self.screen, color_choices[tube_cols[k + tubes_per_row][j]],
-                                     (k * spacing + spacing // 4,
-                                      500 - (color_height * (j + 1))
-                                      , 65, color_height), 0, 5)
-                box = pygame.draw.rect(self.screen, 'teal', [spacing // 4 + spacing * k, 300, 65, 200], 3, 5)
-                if self.selected_tube == k + tubes_per_row:
-                    pygame.draw.rect(self.screen, 'white', [spacing // 4 + spacing * k, 300, 65, 200], 3, 5)
-                tube_boxes.append(box)
-        return tube_boxes
+        return [pygame.Rect(spacing // 4 + spacing * (k % tubes_per_row), 50 if k < tubes_per_row else 300, 65, 200)
+                for k in range(tubes_num)]
 
-    def move_logic(self, tube_cols, sel_tube, dest_tube):
-        """Handle the logic for moving colors between tubes.
+    def draw_tube(self, box, colors, selected):
+        """Draw one tube and its colors.
                 Args:
-                    tube_cols (List[List[int]]): A list of lists representing the colors in each tube.
-                    sel_tube (int): The index of the selected tube.
-                    dest_tube (int): The index of the destination tube.
+                    box (pygame.Rect): The rectangle of the tube.
+                    colors (List[int]): The colors in the tube, bottom to top.
+                    selected (bool): True if the tube is the selected one.
 
                 Returns:
-                    List[List[int]]: Updated tube colors after the move.
+                    pygame.Rect: The area covered by the tube.
         """
-        chain = True
-        length = 1
-        color_on_top = 100
-        color_to_move = 100
-        if len(tube_cols[sel_tube]) > 0:
-            color_to_move = tube_cols[sel_tube][-1]
-            for col in range(1, len(tube_cols[sel_tube])):
-                if chain:
-                    if tube_cols[sel_tube][-1 - col] == color_to_move:
-                        length += 1
-                    else:
-                        chain = False
-        if len(tube_cols[dest_tube]) < self.NColorInTube:
-            if len(tube_cols[dest_tube]) == 0:
-                color_on_top = color_to_move
-            else:
-                color_on_top = tube_cols[dest_tube][-1]
-        if color_on_top == color_to_move and len(tube_cols[sel_tube]) > 0:
-            if sel_tube != dest_tube:
-                self.game_state_history.append(copy.deepcopy(tube_cols))
-                self.move_count += 1
-            for i in range(length):
-                if len(tube_cols[dest_tube]) < self.NColorInTube and len(tube_cols[sel_tube]) > 0:
-                    tube_cols[dest_tube].append(color_to_move)
-                    tube_cols[sel_tube].pop(-1)
-
-        return tube_cols
-
-    def check_victory(self, tube_cols):
-        """Check if the player has won the game.
+        color_height = 200 // self.NColorInTube
+        for j, color in enumerate(colors):
+            pygame.draw.rect(self.screen, color_choices[color],
+                             (box.x, box.bottom - color_height * (j + 1), 65, color_height), 0, 5)
+        return pygame.draw.rect(self.screen, 'white' if selected else 'teal', box, 3, 5)
+
+    def draw_tubes(self, tubes_num, tube_cols):
+        """Draw the tubes whose colors or selection changed since the last frame.
                 Args:
+                    tubes_num (int): The total number of tubes in the game.
                     tube_cols (List[List[int]]): A list of lists representing the colors in each tube.
 
                 Returns:
-                    bool: True if the player has won, False otherwise.
+                    List[pygame.Rect]: A list of pygame.Rect objects representing the rectangles
+                    of the drawn tubes for user interaction.
         """
-        won = True
-        for i in range(len(tube_cols)):
-            if len(tube_cols[i]) > 0:
-                if len(tube_cols[i]) != self.NColorInTube:
-                    won = False
-                else:
-                    main_color = tube_cols[i][-1]
-                    for j in range(len(tube_cols[i])):
-                        if tube_cols[i][j] != main_color:
-                            won = False
-        return won
+        tube_boxes = []
+        for k, box in enumerate(self.tube_boxes(tubes_num)):
+            selected = k == self.selected_tube
+            tube_boxes.append(self.renderer.region(("tube", k), (tuple(tube_cols[k]), selected),
+                                                   lambda: self.draw_tube(box, tube_cols[k], selected)))
+        return tube_boxes
 
     def reset_game(self, colors_count, color_tube_count, empty_tubes):
         """Reset the game with new settings.
@@ -310,90 +265,219 @@ class Game:
         self.NColor = colors_count
         self.NColorInTube = color_tube_count
         self.NEmptyTubes = empty_tubes
-        self.tubes, self.tube_colors = self.generate_start()
-        self.initial_colors = copy.deepcopy(self.tube_colors)
-        self.game_state_history = []
+        self.new_board()
         self.selected_tube = 100
         self.destination_tube = 100
         self.selected = False
-        self.win = False
-        self.move_count = 0
         self.move_text = ""
 
-    def auto_move(self, founded_solution, m_font):
-        """Move the colors automatically based on the solution found by the AI.
+    def auto_move(self, founded_solution):
+        """Queue the moves of the solution found by the AI for animated playback.
                 Args:
                     founded_solution (List[Tuple[int, int]]): A list of tuples representing
                     the source and destination tubes for each move.
-                    :param founded_solution:
-                    :param m_font:
         """
-        for move in founded_solution:
-            self.screen.fill((0, 0, 0))
-            self.clock.tick(fps)
-            self.undo_button.draw(self.screen)
-            self.new_board_button.draw(self.screen)
-            self.solve_game_button.draw(self.screen)
-            self.optimal_solve_button.draw(self.screen)
-            self.reset_button.draw(self.screen)
+        self.playback = list(founded_solution)
+        self.next_move_time = pygame.time.get_ticks()
 
-            self.color_spinner.draw(self.screen)
-            self.empty_tubes_spinner.draw(self.screen)
-            self.colors_in_tube_spinner.draw(self.screen)
-
-            sel_tube, dest_tube = move  # Extract the source and destination tubes from the AI's solution
+    def play_next_move(self):
+        """Make the next playback move once its time has come, without blocking the game loop."""
+        if self.playback and pygame.time.get_ticks() >= self.next_move_time:
+            sel_tube, dest_tube = self.playback.pop(0)  # Extract the source and destination tubes from the AI's solution
             self.tube_colors = self.move_logic(self.tube_colors, sel_tube, dest_tube)
-            self.move_text = m_font.render(f"Move: {self.move_count}", True, 'white')
-            self.screen.blit(self.move_text, (10, 10))
-            self.draw_tubes(self.tubes, self.tube_colors)
-            pygame.display.flip()
-            pygame.time.delay(500)  # Add a delay to slow down the automatic moves for better visualization
+            self.next_move_time += move_delay
+
+    def start_solver(self, method, **options):
+        """Start a search in a background thread so the game loop keeps running.
+                Args:
+                    method (str): The name of the GameSolution search to run, e.g. "solve".
+                    The solution cache is checked first and filled with the result.
+                    **options: Passed on to the search.
+        """
+        self.solver = GameSolution(self, cache=self.solution_cache,
+                                   pattern_db=find_pattern_db(self.NColorInTube, self.tubes))
+        self.last_stats = self.solver.stats
+        self.solver_start = copy.deepcopy(self.tube_colors)
+        self.solver_thread = threading.Thread(target=self.solver.cached_solve,
+                                              args=(copy.deepcopy(self.tube_colors), method), kwargs=options,
+                                              daemon=True)
+        self.solver_thread.start()
+
+    def start_anytime_solver(self):
+        """Start an anytime search whose first solution is played at once while it looks for shorter ones."""
+        self.start_solver("anytime_solve", deadline=perf_counter() + solve_budget, on_solution=self.solutions.put)
+
+    def follow_solution(self, moves):
+        """Play a solution of the board the search started from.
+            While another solution is playing, switch to the new one if the current board lies on it
+            and fewer moves are left.
+                Args:
+                    moves (List[Tuple[int, int]]): The solution, starting from ``solver_start``.
+        """
+        board = copy.deepcopy(self.solver_start)
+        for index in range(len(moves) + 1):
+            if board == self.tube_colors:
+                remaining = moves[index:]
+                if index == 0 and not self.playback:
+                    self.auto_move(remaining)
+                elif len(remaining) < len(self.playback):
+                    self.playback = list(remaining)
+                return
+            if index < len(moves):
+                src, dst = moves[index]
+                apply_pour(board, src, dst, pour_amount(board[src], board[dst], self.NColorInTube))
+
+    def cancel_solver(self):
+        """Stop the running search and any playback in progress."""
+        if self.solver is not None:
+            self.solver.cancel()
+        self.playback = []
+
+    def update_solver(self):
+        """Play the solutions of the background search as they come in and collect its final result."""
+        if self.solver is None:
+            return
+        while not self.solutions.empty():
+            moves = self.solutions.get()
+            if not self.solver.cancelled:
+                self.follow_solution(moves)
+        if self.solver_thread.is_alive():
+            return
+        solution = self.solver
+        self.solver = None
+        self.solver_thread = None
+        if solution.cancelled:
+            print("solving cancelled")
+            return
+        print(solution.solution_found, solution.moves)
+        print("move count:", len(solution.moves))
+        if solution.solution_found:
+            self.follow_solution(solution.moves)
+
+    @staticmethod
+    def stats_lines(stats):
+        """Format the statistics of a search as the lines of the overlay.
+                Args:
+                    stats (SearchStats): The statistics to show.
+
+                Returns:
+                    Tuple[str, ...]: The overlay lines.
+        """
+        return (f"expanded: {stats.nodes_expanded}   generated: {stats.nodes_generated}",
+                f"duplicates: {stats.duplicate_rate:.1%}   nodes/s: {stats.nodes_per_second:.0f}",
+                f"frontier: {stats.frontier_size} (peak {stats.peak_frontier})",
+                f"visited: {stats.visited_size} (peak {stats.peak_visited})",
+                f"expand {stats.expansion_time:.2f}s  hash {stats.hashing_time:.2f}s  "
+                f"heur. {stats.heuristic_time:.2f}s",
+                f"elapsed: {stats.elapsed:.2f}s")
+
+    def draw_stats_overlay(self, lines):
+        """Draw the statistics of a search in an opaque box over the board.
+                Args:
+                    lines (Tuple[str, ...]): The lines returned by stats_lines.
+
+                Returns:
+                    pygame.Rect: The area covered by the overlay.
+        """
+        overlay = pygame.Surface((400, 20 * len(lines) + 10))
+        overlay.fill((25, 25, 25))
+        for i, line in enumerate(lines):
+            overlay.blit(render_text(line, 16, 'white'), (8, 5 + 20 * i))
+        return self.screen.blit(overlay, (WIDTH - 410, 50))
+
+    def draw_frame(self):
+        """Draw the parts of the screen that changed since the last frame."""
+        renderer = self.renderer
+        # The stats overlay and the victory text lie on top of other regions, so showing or hiding
+        # them, like a new tube layout, redraws the whole screen
+        layout = (self.tubes, self.NColorInTube, self.show_stats, self.win)
+        if layout != self.screen_layout:
+            renderer.invalidate()
+            self.screen_layout = layout
+        renderer.begin()
+
+        for button in (self.undo_button, self.new_board_button, self.solve_game_button,
+                       self.optimal_solve_button, self.reset_button):
+            renderer.region(button, (button.text, button.color), lambda: button.draw(self.screen))
+        for spinner in (self.color_spinner, self.empty_tubes_spinner, self.colors_in_tube_spinner):
+            renderer.region(spinner, spinner.value, lambda: spinner.draw(self.screen))
+
+        self.move_text = render_text(f"Move: {self.move_count}", 24, 'teal')
+        renderer.region("move", self.move_count, lambda: self.screen.blit(self.move_text, (10, 10)))
+        if self.solver is not None or self.playback:
+            renderer.region(self.cancel_button, None, lambda: self.cancel_button.draw(self.screen))
+        else:
+            renderer.erase(self.cancel_button)
+        if self.solver is not None:
+            progress = (f"Solving... nodes: {self.solver.stats.nodes_expanded}  "
+                        f"frontier: {self.solver.stats.frontier_size}")
+            renderer.region("progress", progress,
+                            lambda: self.screen.blit(render_text(progress, 24, 'teal'), (150, 10)))
+        else:
+            renderer.erase("progress")
+
+        if not self.new_game:
+            self.tube_rects = self.draw_tubes(self.tubes, self.tube_colors)
+
+        if self.show_stats and self.last_stats is not None:
+            lines = self.stats_lines(self.last_stats)
+            renderer.overlay("stats", lines, lambda: self.draw_stats_overlay(lines))
+        if self.win:
+            renderer.overlay("victory", None, lambda: self.screen.blit(
+                render_text('You win! press <Enter> to new game or press <Space> to reset!', 27, 'yellow'), (110, 0)))
+        renderer.present()
 
     def run_game(self):
         """Run the main game loop."""
         while self.run:
-            self.screen.fill((0, 0, 0))
             self.clock.tick(fps)
-            self.undo_button.draw(self.screen)
-            self.new_board_button.draw(self.screen)
-            self.solve_game_button.draw(self.screen)
-            self.optimal_solve_button.draw(self.screen)
-            self.reset_button.draw(self.screen)
-
-            self.color_spinner.draw(self.screen)
-            self.empty_tubes_spinner.draw(self.screen)
-            self.colors_in_tube_spinner.draw(self.screen)
-
-            move_font = pygame.font.SysFont("Arial", 24)
-            self.move_text = move_font.render(f"Move: {self.move_count}", True, 'teal')
-            self.screen.blit(self.move_text, (10, 10))
+            self.update_solver()
+            self.play_next_move()
 
             if self.new_game:
-                self.tubes, self.tube_colors = self.generate_start()
-                self.initial_colors = copy.deepcopy(self.tube_colors)
+                self.new_board()
                 self.new_game = False
-            else:
-                self.tube_rects = self.draw_tubes(self.tubes, self.tube_colors)
             self.win = self.check_victory(self.tube_colors)
             # Event loop
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.cancel_solver()
                     self.run = False
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                    self.show_stats = not self.show_stats
+                if self.solver is not None or self.playback:
+                    # Only cancellation is handled while a search or a playback is running
+                    if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                        self.cancel_solver()
+                    if event.type == pygame.MOUSEBUTTONDOWN and self.cancel_button.rect.collidepoint(event.pos):
+                        self.cancel_solver()
+                    continue
                 if self.win:
                     if event.type == pygame.KEYDOWN:
                         if event.key == pygame.K_RETURN:
                             self.reset_game(self.color_spinner.value, self.colors_in_tube_spinner.value,
                                             self.empty_tubes_spinner.value)
                         if event.key == pygame.K_SPACE:
-                            self.tube_colors = copy.deepcopy(self.initial_colors)
+                            self.seek(0)
                             self.win = False
                             self.new_game = False
-                            self.move_count = 0
-                            self.game_state_history = []
                 if not self.win or self.move_count == 0:
                     self.color_spinner.update(event)
                     self.empty_tubes_spinner.update(event)
                     self.colors_in_tube_spinner.update(event)
+                    if event.type == pygame.KEYDOWN:
+                        # <Left>/<Right> step through the history, <Home>/<End> jump to its ends
+                        if event.key == pygame.K_LEFT:
+                            self.undo()
+                        if event.key == pygame.K_RIGHT:
+                            self.redo()
+                        if event.key == pygame.K_HOME:
+                            self.seek(0)
+                        if event.key == pygame.K_END:
+                            self.seek(len(self.history))
+                        if event.key == pygame.K_F2:
+                            self.save_replay(replay_path)
+                            print("replay saved to", replay_path)
                     if event.type == pygame.MOUSEBUTTONDOWN:
                         if not self.selected:
                             for i in range(len(self.tube_rects)):
@@ -411,9 +495,7 @@ class Game:
                                     self.selected_tube = 100
                         if self.undo_button.rect.collidepoint(event.pos):
                             # Handle the "Undo" button click
-                            if self.game_state_history:
-                                self.tube_colors = self.game_state_history.pop()
-                                self.move_count -= 1
+                            self.undo()
                         if self.new_board_button.rect.collidepoint(event.pos):
                             # Handle the "New Game" button click
                             self.tube_colors.pop()
@@ -421,31 +503,17 @@ class Game:
                                             self.empty_tubes_spinner.value)
                         if self.solve_game_button.rect.collidepoint(event.pos):
                             print("solving...")
-                            solution = GameSolution(self)
-                            solution.solve(self.tube_colors)
-                            print(solution.solution_found, solution.moves)
-                            print("move count:", len(solution.moves))
-                            if solution.solution_found:
-                                self.auto_move(solution.moves, move_font)
+                            self.start_anytime_solver()
                         if self.optimal_solve_button.rect.collidepoint(event.pos):
                             print("optimal solving...")
-                            solution = GameSolution(self)
-                            solution.optimal_solve(self.tube_colors)
-                            print(solution.solution_found, solution.moves)
-                            print("optimal move count:", len(solution.moves))
-                            if solution.solution_found:
-                                self.auto_move(solution.moves, move_font)
+                            self.start_solver("optimal_solve")
                         if self.reset_button.rect.collidepoint(event.pos):
-                            self.tube_colors = copy.deepcopy(self.initial_colors)
+                            # Back to the start; the moves stay in the history for <Right>/<End>
+                            self.seek(0)
                             self.win = False
                             self.new_game = False
-                            self.move_count = 0
-                            self.game_state_history = []
 
-            if self.win:
-                victory_text = self.font.render('You win! press <Enter> to new game or press <Space> to reset!', True
-                                                , 'yellow')
-                self.screen.blit(victory_text, (110, 0))
-            pygame.display.flip()
+            self.draw_frame()
 
+        self.solution_cache.close()
         pygame.quit()
@@ -0,0 +1,107 @@
+# Vectorized move generation and duplicate detection for whole BFS layers
+import numpy as np
+from packed_board import PackedBoard
+
+
+class LayerBoard:
+    """Applies the solver's move rules to many packed states at once.
+
+        A layer is a 2D ``uint8`` array with one packed state (the ``PackedBoard`` layout) per row,
+        so ``layer[k].tobytes()`` is the state the other searches use. Legal pours, solved checks
+        and duplicate-detection keys are computed for the whole layer with array operations.
+
+        Attributes:
+            tube_numbers (int): The number of tubes on the board.
+            capacity (int): The maximum number of colors in a single tube.
+            width (int): The number of bytes used by one tube slot.
+            canonical (bool): Whether keys are canonical, equal for boards that only differ in tube
+                order, or the packed rows themselves.
+            packed (PackedBoard): The codec for single states.
+    """
+    def __init__(self, tube_numbers, capacity, canonical=True):
+        self.tube_numbers = tube_numbers
+        self.capacity = capacity
+        self.width = capacity + 1
+        self.canonical = canonical
+        self.packed = PackedBoard(tube_numbers, capacity)
+        # Tube slots are ordered by a 64-bit value: the slot bytes themselves when they fit, else a hash.
+        # Two different slots with equal hashes only risk a missed duplicate, never a wrong one.
+        self._multipliers = np.random.default_rng(0).integers(1, 2 ** 63, self.width, dtype=np.uint64) | 1
+        self._pairs = np.array([(i, j) for i in range(tube_numbers) for j in range(tube_numbers) if i != j])
+
+    def layer(self, tube_colors):
+        """Return a one-row layer holding the board ``tube_colors``."""
+        return np.frombuffer(self.packed.pack(tube_colors), dtype=np.uint8).reshape(1, -1).copy()
+
+    def _tubes(self, layer):
+        return layer.reshape(len(layer), self.tube_numbers, self.width)
+
+    def solved(self, layer):
+        """Return a boolean per row: every non-empty tube is full of a single color."""
+        tubes = self._tubes(layer)
+        lengths, cells = tubes[:, :, 0], tubes[:, :, 1:]
+        uniform = (cells == cells[:, :, :1]).all(axis=2)
+        return ((lengths == 0) | ((lengths == self.capacity) & uniform)).all(axis=1)
+
+    def keys(self, layer):
+        """Return the key of every row, viewed as one void scalar: its tube slots sorted when canonical."""
+        if not self.canonical:
+            return np.ascontiguousarray(layer).view(f"V{layer.shape[1]}").ravel()
+        tubes = self._tubes(layer)
+        if self.width <= 8:
+            padded = np.zeros(tubes.shape[:2] + (8,), dtype=np.uint8)
+            padded[:, :, 8 - self.width:] = tubes
+            order_keys = padded.view(">u8")[:, :, 0]
+        else:
+            order_keys = (tubes.astype(np.uint64) * self._multipliers).sum(axis=2, dtype=np.uint64)
+        order = np.argsort(order_keys, axis=1, kind="stable")
+        canonical = np.take_along_axis(tubes, order[:, :, None], axis=1)
+        return np.ascontiguousarray(canonical).reshape(layer.shape).view(f"V{layer.shape[1]}").ravel()
+
+    def expand(self, layer):
+        """Generate the children of every row with the ``legal_moves`` rules.
+                Args:
+                    layer (np.ndarray): The (states, bytes) layer.
+
+                Returns:
+                    Tuple[np.ndarray, np.ndarray, np.ndarray]: The children, the row of each child's
+                    parent and the (src, dst) move of each child.
+        """
+        cap = self.capacity
+        tubes = self._tubes(layer)
+        lengths = tubes[:, :, 0].astype(np.int64)
+        cells = tubes[:, :, 1:]
+        top_index = np.maximum(lengths - 1, 0)
+        top = np.take_along_axis(cells, top_index[:, :, None], axis=2)[:, :, 0]
+        # The top run ends below the highest cell under the top that has another color
+        positions = np.arange(cap)
+        other = (cells != top[:, :, None]) & (positions < lengths[:, :, None])
+        run = lengths - 1 - np.where(other, positions, -1).max(axis=2)
+        run[lengths == 0] = 0
+        empty = lengths == 0
+        first_empty = np.where(empty.any(axis=1), empty.argmax(axis=1), -1)
+
+        src, dst = self._pairs[:, 0], self._pairs[:, 1]
+        src_len, dst_len = lengths[:, src], lengths[:, dst]
+        same_color = (dst_len > 0) & (dst_len < cap) & (top[:, dst] == top[:, src])
+        into_empty = (dst_len == 0) & (dst[None, :] == first_empty[:, None]) & (run[:, src] < src_len)
+        legal = (src_len > 0) & (same_color | into_empty)
+        parent, pair = np.nonzero(legal)
+        src, dst = src[pair], dst[pair]
+        amount = np.minimum(run[parent, src], cap - lengths[parent, dst])
+
+        children = tubes[parent]
+        rows = np.arange(len(parent))
+        color = top[parent, src]
+        src_len, dst_len = lengths[parent, src], lengths[parent, dst]
+        src_cells = children[rows, src, 1:]
+        src_cells[positions >= (src_len - amount)[:, None]] = 0
+        children[rows, src, 1:] = src_cells
+        children[rows, src, 0] = src_len - amount
+        dst_cells = children[rows, dst, 1:]
+        fill = (positions >= dst_len[:, None]) & (positions < (dst_len + amount)[:, None])
+        dst_cells[fill] = np.broadcast_to(color[:, None], fill.shape)[fill]
+        children[rows, dst, 1:] = dst_cells
+        children[rows, dst, 0] = dst_len + amount
+        moves = np.stack([src, dst], axis=1)
+        return children.reshape(len(parent), layer.shape[1]), parent, moves
@@ -1,5 +1,16 @@
+import argparse
 from game import Game
 
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description="Play water sort.")
+    parser.add_argument("--puzzles", help="pack file written by puzzle_generator.py to draw boards from")
+    parser.add_argument("--replay", help="replay file saved with <F2> to step through with <Left>/<Right>")
+    args = parser.parse_args()
+    pack = None
+    if args.puzzles:
+        from puzzle_generator import PuzzlePack
+        pack = PuzzlePack(args.puzzles)
+    game = Game(pack)
+    if args.replay:
+        game.load_replay(args.replay)
     game.run_game()
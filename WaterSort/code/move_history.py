@@ -0,0 +1,118 @@
+# Append-only move log with undo, redo, seeking and replay files
+import json
+
+
+def apply_pour(tube_cols, src, dst, amount):
+    """Move ``amount`` colors from the top of tube ``src`` onto tube ``dst`` in place."""
+    color = tube_cols[src][-1]
+    del tube_cols[src][-amount:]
+    tube_cols[dst].extend([color] * amount)
+
+
+class MoveHistory:
+    """The moves of a game as compact (src, dst, amount) deltas instead of board copies.
+
+        A pour is undone by pouring the same amount back, so undo and redo cost one move each and
+        the log grows with the number of moves, not with moves times board size. Moves after the
+        current position are kept for redo until a new move is recorded.
+
+        Attributes:
+            moves (List[Tuple[int, int, int]]): The (source, destination, amount) of every move.
+            position (int): The number of moves currently applied to the board.
+    """
+    def __init__(self, moves=()):
+        self.moves = [tuple(move) for move in moves]
+        self.position = 0
+
+    def __len__(self):
+        return len(self.moves)
+
+    def record(self, src, dst, amount):
+        """Append a move made on the board, dropping the moves that could have been redone."""
+        del self.moves[self.position:]
+        self.moves.append((src, dst, amount))
+        self.position += 1
+
+    def clear(self):
+        """Forget every move."""
+        self.moves = []
+        self.position = 0
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.moves)
+
+    def undo(self, tube_cols):
+        """Take back the last applied move.
+                Args:
+                    tube_cols (List[List[int]]): The board, changed in place.
+
+                Returns:
+                    bool: False if there was no move to undo.
+        """
+        if not self.can_undo():
+            return False
+        self.position -= 1
+        src, dst, amount = self.moves[self.position]
+        apply_pour(tube_cols, dst, src, amount)
+        return True
+
+    def redo(self, tube_cols):
+        """Make the next undone move again.
+                Args:
+                    tube_cols (List[List[int]]): The board, changed in place.
+
+                Returns:
+                    bool: False if there was no move to redo.
+        """
+        if not self.can_redo():
+            return False
+        src, dst, amount = self.moves[self.position]
+        apply_pour(tube_cols, src, dst, amount)
+        self.position += 1
+        return True
+
+    def seek(self, tube_cols, index, initial_colors=None):
+        """Bring the board to the position after move ``index``.
+            Moves are undone or redone from the current position; when ``initial_colors`` is given
+            and the target is closer to the start, the board is rebuilt from it and replayed instead.
+                Args:
+                    tube_cols (List[List[int]]): The board, changed in place.
+                    index (int): The number of moves to have applied, clamped to the log.
+                    initial_colors (List[List[int]]): The board before the first move.
+        """
+        index = max(0, min(index, len(self.moves)))
+        if initial_colors is not None and index < abs(self.position - index):
+            tube_cols[:] = [list(tube) for tube in initial_colors]
+            self.position = 0
+        while self.position > index:
+            self.undo(tube_cols)
+        while self.position < index:
+            self.redo(tube_cols)
+
+    def save(self, path, initial_colors, colors_in_tube):
+        """Write a replay file: the starting board, the tube capacity and every move.
+                Args:
+                    path (str): The replay file.
+                    initial_colors (List[List[int]]): The board before the first move.
+                    colors_in_tube (int): The maximum number of colors in a single tube.
+        """
+        with open(path, "w") as replay:
+            json.dump(dict(colors_in_tube=colors_in_tube, initial=initial_colors,
+                           moves=[list(move) for move in self.moves]), replay)
+
+    @classmethod
+    def load(cls, path):
+        """Read a replay file written by save().
+                Args:
+                    path (str): The replay file.
+
+                Returns:
+                    Tuple[MoveHistory, List[List[int]], int]: The history positioned before the
+                    first move, the starting board and the tube capacity.
+        """
+        with open(path) as replay:
+            data = json.load(replay)
+        return cls(data["moves"]), data["initial"], data["colors_in_tube"]
@@ -0,0 +1,66 @@
+# Move rules shared by the game and the solver
+def top_run(tube):
+    """Return the length of the same-colored run on top of a tube.
+            Args:
+                tube (Sequence[int]): The colors in the tube, bottom to top.
+
+            Returns:
+                int: The number of colors that a pour from this tube moves at most.
+    """
+    if not tube:
+        return 0
+    color = tube[-1]
+    length = 1
+    while length < len(tube) and tube[-1 - length] == color:
+        length += 1
+    return length
+
+
+def pour_amount(src, dst, capacity):
+    """Return how many colors a pour from ``src`` into ``dst`` moves.
+        The whole run on top of ``src`` is poured, limited by the free space in ``dst``.
+            Args:
+                src (Sequence[int]): The colors in the source tube.
+                dst (Sequence[int]): The colors in the destination tube.
+                capacity (int): The maximum number of colors in a single tube.
+
+            Returns:
+                int: The number of colors moved, 0 if the pour is not legal.
+    """
+    if not src or len(dst) >= capacity or (dst and dst[-1] != src[-1]):
+        return 0
+    return min(top_run(src), capacity - len(dst))
+
+
+def legal_moves(tubes, capacity):
+    """Generate the useful pours of a board.
+        Every pour moves the full top run like ``pour_amount``. Pours that can never shorten a
+        solution are dropped: pouring a single-colored tube into an empty one only swaps two
+        tubes, and all empty tubes are equivalent, so only the first one is used as a target.
+            Args:
+                tubes (Sequence[Sequence[int]]): The colors in each tube.
+                capacity (int): The maximum number of colors in a single tube.
+
+            Returns:
+                Iterator[Tuple[int, int, int]]: The (src, dst, amount) of each pour.
+    """
+    first_empty = -1
+    runs = []
+    for i, tube in enumerate(tubes):
+        if not tube and first_empty < 0:
+            first_empty = i
+        runs.append(top_run(tube))
+    for i, src in enumerate(tubes):
+        run = runs[i]
+        if not run:
+            continue
+        color = src[-1]
+        uniform = run == len(src)
+        for j, dst in enumerate(tubes):
+            if i == j:
+                continue
+            if not dst:
+                if j == first_empty and not uniform:
+                    yield i, j, run
+            elif len(dst) < capacity and dst[-1] == color:
+                yield i, j, min(run, capacity - len(dst))
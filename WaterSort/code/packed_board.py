@@ -0,0 +1,129 @@
+# Compact state encoding used by the solver
+from moves import legal_moves, pour_amount
+
+
+class PackedBoard:
+    """Codec between the game's list-of-lists tubes and packed solver states.
+
+        A packed state is an immutable ``bytes`` object with one fixed-width slot per
+        tube. The first byte of a slot holds the number of colors in the tube and the
+        next ``capacity`` bytes hold the colors from bottom to top; unused bytes are
+        zero. Hashing and equality of ``bytes`` run in C, so states can be stored in
+        sets and dicts directly, and a child state is one ``bytearray`` copy.
+
+        Attributes:
+            tube_numbers (int): The number of tubes on the board.
+            capacity (int): The maximum number of colors in a single tube.
+            width (int): The number of bytes used by one tube slot.
+    """
+    def __init__(self, tube_numbers, capacity):
+        self.tube_numbers = tube_numbers
+        self.capacity = capacity
+        self.width = capacity + 1
+
+    def pack(self, tube_colors):
+        """Encode a list of tubes into a packed state.
+                Args:
+                    tube_colors (List[List[int]]): The colors in each tube.
+
+                Returns:
+                    bytes: The packed state.
+        """
+        buf = bytearray(self.tube_numbers * self.width)
+        for i, tube in enumerate(tube_colors):
+            base = i * self.width
+            buf[base] = len(tube)
+            buf[base + 1:base + 1 + len(tube)] = bytes(tube)
+        return bytes(buf)
+
+    def unpack(self, state):
+        """Decode a packed state back into a list of tubes.
+                Args:
+                    state (bytes): The packed state.
+
+                Returns:
+                    List[List[int]]: The colors in each tube.
+        """
+        return [list(self.tube(state, i)) for i in range(self.tube_numbers)]
+
+    def length(self, state, i):
+        """Return the number of colors in tube ``i``."""
+        return state[i * self.width]
+
+    def tube(self, state, i):
+        """Return the colors of tube ``i`` (bottom to top) as ``bytes``."""
+        base = i * self.width
+        return state[base + 1:base + 1 + state[base]]
+
+    def tubes(self, state):
+        """Return the colors of every tube as a list of ``bytes``."""
+        return [self.tube(state, i) for i in range(self.tube_numbers)]
+
+    def canonical(self, state):
+        """Return a key for ``state`` that does not depend on the order of the tubes.
+                Two states that differ only by a permutation of their tubes get the same key.
+        """
+        w = self.width
+        return b''.join(sorted([state[i * w:(i + 1) * w] for i in range(self.tube_numbers)]))
+
+    def run_count(self, state):
+        """Return the total number of same-colored runs over all tubes."""
+        runs = 0
+        for i in range(self.tube_numbers):
+            tube = self.tube(state, i)
+            if tube:
+                runs += 1 + sum(1 for k in range(1, len(tube)) if tube[k] != tube[k - 1])
+        return runs
+
+    def canonical_order(self, state):
+        """Return the tube indices in the order used by ``canonical``.
+                Position ``c`` of the canonical key holds tube ``order[c]`` of ``state``.
+        """
+        w = self.width
+        return sorted(range(self.tube_numbers), key=lambda i: state[i * w:(i + 1) * w])
+
+    def is_solved(self, state):
+        """Return True when every non-empty tube is full of a single color, like ``Game.check_victory``."""
+        for i in range(self.tube_numbers):
+            tube = self.tube(state, i)
+            if tube and (len(tube) != self.capacity or tube.count(tube[0]) != len(tube)):
+                return False
+        return True
+
+    def pour(self, state, src, dst, amount):
+        """Return the state reached by moving ``amount`` colors from ``src`` to ``dst``.
+                Args:
+                    state (bytes): The packed state.
+                    src (int): The index of the source tube.
+                    dst (int): The index of the destination tube.
+                    amount (int): The number of colors to move.
+
+                Returns:
+                    bytes: The packed child state.
+        """
+        w = self.width
+        src_base, dst_base = src * w, dst * w
+        src_len, dst_len = state[src_base], state[dst_base]
+        color = state[src_base + src_len]
+        buf = bytearray(state)
+        buf[src_base] = src_len - amount
+        buf[src_base + 1 + src_len - amount:src_base + 1 + src_len] = bytes(amount)
+        buf[dst_base] = dst_len + amount
+        buf[dst_base + 1 + dst_len:dst_base + 1 + dst_len + amount] = bytes((color,)) * amount
+        return bytes(buf)
+
+    def apply(self, state, src, dst):
+        """Return the state after pouring ``src`` into ``dst`` like ``Game.move_logic``, or None if illegal."""
+        amount = pour_amount(self.tube(state, src), self.tube(state, dst), self.capacity) if src != dst else 0
+        return self.pour(state, src, dst, amount) if amount else None
+
+    def next_states(self, state):
+        """Generate the states reachable with one pour, using the shared ``legal_moves`` rules.
+                Args:
+                    state (bytes): The packed state.
+
+                Returns:
+                    List[Tuple[bytes, Tuple[int, int]]]: The child states and their (src, dst) moves.
+        """
+        return [(self.pour(state, i, j, amount), (i, j))
+                for i, j, amount in legal_moves(self.tubes(state), self.capacity)]
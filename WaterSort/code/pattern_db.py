@@ -0,0 +1,299 @@
+# Additive pattern databases for the solver heuristic:
+#   python pattern_db.py --colors-in-tube 4 --tubes 14
+import argparse
+import functools
+import itertools
+import mmap
+import os
+import struct
+import zlib
+
+PDB_MAGIC = b"WSPD"
+PDB_VERSION = 1
+PDB_HEADER = struct.Struct("<4sBBBBI")  # magic, version, colors in tube, tubes, group size, slot count
+EMPTY_SLOT = 255
+UNSOLVABLE = 254
+pdb_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pattern_dbs")
+
+
+def table_path(colors_in_tube, tubes, group_size, directory=pdb_dir):
+    """Return the file of the table for one board configuration and group size."""
+    return os.path.join(directory, f"pdb_c{colors_in_tube}_t{tubes}_g{group_size}.bin")
+
+
+# The abstraction of a group of colors keeps the cells of those colors (1..group size) and turns every
+# other color into the wildcard 0. Pours of other colors cost nothing, so wildcards on top of a tube are
+# dropped, tubes holding only wildcards count as empty, and each tube is a pattern ending in a group color.
+# Every real pour moves one color, so it costs 1 in exactly one group: the costs of disjoint groups add up
+# to an admissible estimate.
+
+def _slot(pattern, colors_in_tube):
+    return bytes((len(pattern),)) + bytes(pattern) + bytes(colors_in_tube - len(pattern))
+
+
+def _key(patterns, colors_in_tube, group_size):
+    slots = [_slot(pattern, colors_in_tube) for pattern in patterns]
+    slots += [bytes(colors_in_tube + 1)] * (group_size * colors_in_tube - len(slots))
+    return b"".join(sorted(slots))
+
+
+def _patterns(colors_in_tube, group_size):
+    return [pattern for length in range(1, colors_in_tube + 1)
+            for pattern in itertools.product(range(group_size + 1), repeat=length) if pattern[-1]]
+
+
+def abstract_states(colors_in_tube, tubes, group_size):
+    """Generate every abstract board of a group: multisets of patterns holding each group color
+        ``colors_in_tube`` times on at most ``tubes`` tubes.
+    """
+    patterns = _patterns(colors_in_tube, group_size)
+    counts = [tuple(pattern.count(color) for color in range(1, group_size + 1)) for pattern in patterns]
+
+    def extend(index, remaining, free_tubes, chosen):
+        if not any(remaining):
+            yield tuple(chosen)
+            return
+        if index == len(patterns) or not free_tubes:
+            return
+        yield from extend(index + 1, remaining, free_tubes, chosen)
+        taken = 0
+        while True:
+            remaining = tuple(r - c for r, c in zip(remaining, counts[index]))
+            taken += 1
+            if min(remaining) < 0 or taken > free_tubes:
+                break
+            yield from extend(index + 1, remaining, free_tubes - taken, chosen + [patterns[index]] * taken)
+
+    yield from extend(0, (colors_in_tube,) * group_size, tubes, [])
+
+
+def abstract_moves(state, colors_in_tube, tubes):
+    """Generate the abstract boards reachable with one pour of a group color."""
+    empty = len(state) < tubes
+    for i, src in enumerate(state):
+        color = src[-1]
+        run = 1
+        while run < len(src) and src[-1 - run] == color:
+            run += 1
+        rest = list(state[:i] + state[i + 1:])
+        targets = [j for j, dst in enumerate(rest) if dst[-1] == color and len(dst) < colors_in_tube]
+        if empty and run < len(src):
+            targets.append(None)
+        for j in targets:
+            dst = rest[j] if j is not None else ()
+            amount = min(run, colors_in_tube - len(dst))
+            child = [tube for k, tube in enumerate(rest) if k != j] + [dst + (color,) * amount]
+            left = src[:-amount]
+            while left and not left[-1]:
+                left = left[:-1]  # wildcards exposed by the pour are free to move away
+            if left:
+                child.append(left)
+            yield child
+
+
+def build_table(colors_in_tube, tubes, group_size):
+    """Compute the exact abstract cost of every board of a group.
+            Args:
+                colors_in_tube (int): The tube capacity.
+                tubes (int): The number of tubes on the board.
+                group_size (int): The number of colors tracked by the table.
+
+            Returns:
+                Tuple[List[bytes], np.ndarray]: The abstract keys and their costs (UNSOLVABLE if none).
+    """
+    import numpy as np  # only needed to build tables, not to use them
+
+    keys = [_key(state, colors_in_tube, group_size) for state in abstract_states(colors_in_tube, tubes, group_size)]
+    index = {key: i for i, key in enumerate(keys)}
+    sources, targets = [], []
+    for i, state in enumerate(abstract_states(colors_in_tube, tubes, group_size)):
+        for child in abstract_moves(state, colors_in_tube, tubes):
+            sources.append(i)
+            targets.append(index[_key(child, colors_in_tube, group_size)])
+    goal = _key([(color,) * colors_in_tube for color in range(1, group_size + 1)], colors_in_tube, group_size)
+    cost = np.full(len(keys), UNSOLVABLE, dtype=np.int32)
+    cost[index[goal]] = 0
+    sources, targets = np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64)
+    # Bellman sweeps over all edges at once until no cost improves
+    while True:
+        best = cost.copy()
+        np.minimum.at(best, sources, cost[targets] + 1)
+        if np.array_equal(best, cost):
+            break
+        cost = best
+    return keys, np.minimum(cost, UNSOLVABLE).astype(np.uint8)
+
+
+def write_table(path, colors_in_tube, tubes, group_size, keys, costs):
+    """Store a table as an open-addressing hash table that lookups can probe through a memory map."""
+    slots = 1 << (2 * len(keys) - 1).bit_length()
+    width = len(keys[0]) + 1
+    data = bytearray([EMPTY_SLOT]) * (slots * width)
+    for key, cost in zip(keys, costs.tolist()):
+        slot = zlib.crc32(key) & (slots - 1)
+        while data[slot * width + width - 1] != EMPTY_SLOT:
+            slot = (slot + 1) & (slots - 1)
+        data[slot * width:(slot + 1) * width] = key + bytes((cost,))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as table:
+        table.write(PDB_HEADER.pack(PDB_MAGIC, PDB_VERSION, colors_in_tube, tubes, group_size, slots))
+        table.write(data)
+
+
+class PatternTable:
+    """A memory-mapped table of abstract costs for one group size.
+
+        Attributes:
+            path (str): The table file.
+            colors_in_tube (int): The tube capacity of the table.
+            tubes (int): The number of tubes of the table.
+            group_size (int): The number of colors in each group.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as table:
+            self._map = mmap.mmap(table.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.colors_in_tube, self.tubes, self.group_size, self._slots = \
+            PDB_HEADER.unpack(self._map[:PDB_HEADER.size])
+        if magic != PDB_MAGIC or version != PDB_VERSION:
+            raise ValueError(f"{path} is not a version {PDB_VERSION} pattern database")
+        self._width = self.group_size * self.colors_in_tube * (self.colors_in_tube + 1) + 1  # key + cost
+        self._padding = [bytes(n) for n in range(self.colors_in_tube + 1)]
+        # Boards share most of their abstract keys with their parents, so recent lookups are kept
+        self.lookup = functools.lru_cache(maxsize=1 << 16)(self._probe)
+
+    def _probe(self, key):
+        width, mask, data = self._width, self._slots - 1, self._map
+        slot = zlib.crc32(key) & mask
+        while True:
+            base = PDB_HEADER.size + slot * width
+            cost = data[base + width - 1]
+            if cost == EMPTY_SLOT or data[base:base + width - 1] == key:
+                return cost
+            slot = (slot + 1) & mask
+
+    def cost(self, tubes, translation):
+        """Return the abstract cost of a board for the group encoded by ``translation``.
+                Args:
+                    tubes (List[bytes]): The colors of every tube.
+                    translation (bytes): Maps the group colors to 1..group size and other colors to 0.
+
+                Returns:
+                    float: The number of pours of group colors still needed, inf if there is no way.
+        """
+        cap = self.colors_in_tube
+        slots = [bytes(cap + 1)] * (self.group_size * cap)
+        for tube in tubes:
+            pattern = tube.translate(translation).rstrip(b"\0")
+            if pattern:
+                slots.append(bytes((len(pattern),)) + pattern + self._padding[cap - len(pattern)])
+        slots.sort()
+        cost = self.lookup(b"".join(slots[-self.group_size * cap:]))
+        return cost if cost < UNSOLVABLE else float("inf")
+
+    def __getstate__(self):
+        # Pool workers reopen the file instead of receiving the mapped bytes
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+class PatternDatabase:
+    """The pattern tables of one board configuration, combined into an additive heuristic.
+
+        The colors are split into disjoint groups of the largest available group size; the costs of
+        the groups are added, and the largest sum over a few different splits is used. One split
+        groups the colors that lie on each other most often on the starting board, because those
+        are the colors whose pours get in each other's way.
+
+        Attributes:
+            tables (Dict[int, PatternTable]): The loaded tables by group size.
+    """
+    def __init__(self, tables):
+        self.tables = {table.group_size: table for table in tables}
+
+    @classmethod
+    def open(cls, colors_in_tube, tubes, directory=pdb_dir):
+        """Load the tables built for a configuration, or return None if there are none."""
+        tables = [PatternTable(path) for path in (table_path(colors_in_tube, tubes, size, directory)
+                                                  for size in range(1, 4)) if os.path.exists(path)]
+        return cls(tables) if tables else None
+
+    def _split(self, order):
+        size = max(self.tables)
+        split = []
+        for start in range(0, len(order), size):
+            group = order[start:start + size]
+            table = self.tables.get(len(group))
+            if table is None:
+                continue  # a smaller leftover group without its table only weakens the estimate
+            translation = bytearray(256)
+            for symbol, color in enumerate(group, 1):
+                translation[color] = symbol
+            split.append((table, bytes(translation)))
+        return split
+
+    def splits(self, colors, tube_colors=None):
+        """Return the color splits used by ``heuristic``.
+                Args:
+                    colors (int): The number of colors on the board.
+                    tube_colors (List[List[int]]): The starting board, used to group touching colors.
+
+                Returns:
+                    list: Every split as a list of (table, translation) pairs.
+        """
+        size = max(self.tables)
+        offsets = range(size) if colors > size else range(1)
+        orders = [[(color + offset) % colors for color in range(colors)] for offset in offsets]
+        if tube_colors is not None and size > 1:
+            touching = {}
+            for tube in tube_colors:
+                for below, above in zip(tube, tube[1:]):
+                    if below != above:
+                        pair = (min(below, above), max(below, above))
+                        touching[pair] = touching.get(pair, 0) + 1
+            # Greedy matching, most touching pairs first; groups are cut from the matched pairs in order
+            order = []
+            for pair in sorted(touching, key=touching.get, reverse=True):
+                if pair[0] not in order and pair[1] not in order:
+                    order += pair
+            order += [color for color in range(colors) if color not in order]
+            orders.append(order)
+        return [self._split(order) for order in orders]
+
+    def heuristic(self, tubes, splits):
+        """Return the additive estimate of a board.
+                Args:
+                    tubes (List[bytes]): The colors of every tube.
+                    splits (list): The result of ``splits`` for the board's number of colors.
+
+                Returns:
+                    float: A lower bound on the number of pours left.
+        """
+        return max(sum(table.cost(tubes, translation) for table, translation in split) for split in splits)
+
+
+@functools.lru_cache(maxsize=None)
+def find_pattern_db(colors_in_tube, tubes):
+    """Return the shared database of a configuration from ``pdb_dir``, None if it was not built."""
+    return PatternDatabase.open(colors_in_tube, tubes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the pattern databases of a board configuration.")
+    parser.add_argument("--colors-in-tube", type=int, default=4, help="CTube")
+    parser.add_argument("--tubes", type=int, nargs="+", default=[14], help="total numbers of tubes")
+    parser.add_argument("--group-sizes", type=int, nargs="+", default=[1, 2],
+                        help="colors per table; 2 is practical up to 4 colors in a tube")
+    parser.add_argument("--directory", default=pdb_dir)
+    args = parser.parse_args(argv)
+    for tubes, group_size in itertools.product(args.tubes, args.group_sizes):
+        keys, costs = build_table(args.colors_in_tube, tubes, group_size)
+        path = table_path(args.colors_in_tube, tubes, group_size, args.directory)
+        write_table(path, args.colors_in_tube, tubes, group_size, keys, costs)
+        print(f"{path}: {len(keys)} boards, max cost {costs[costs < UNSOLVABLE].max()}")
+
+
+if __name__ == "__main__":
+    main()
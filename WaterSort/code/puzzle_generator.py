@@ -0,0 +1,183 @@
+# Bulk generation of certified-solvable puzzle packs:
+#   python puzzle_generator.py --colors 6 --count 100000 --output six.wsp
+import argparse
+import struct
+from multiprocessing import Pool
+from types import SimpleNamespace
+import numpy as np
+from ai_solution import GameSolution
+
+PACK_MAGIC = b"WSPZ"
+PACK_VERSION = 1
+PACK_HEADER = struct.Struct("<4sBBBB")  # magic, version, colors, empty tubes, colors in tube
+
+
+def record_dtype(colors, colors_in_tube):
+    """Return the fixed-size record of one puzzle in a pack.
+        ``board`` holds the full tubes one after another (the empty tubes are implicit), ``length``
+        the certified solution length, ``nodes`` the states the certifying search expanded and
+        ``branching`` its mean number of children per expanded state.
+    """
+    return np.dtype([("board", np.uint8, (colors * colors_in_tube,)), ("length", "<u2"),
+                     ("nodes", "<u4"), ("branching", "<f4")])
+
+
+def random_boards(rng, count, colors, colors_in_tube):
+    """Shuffle ``count`` boards at once, dropping boards that are already sorted.
+            Args:
+                rng (np.random.Generator): The random generator.
+                count (int): The number of boards to draw.
+                colors (int): The number of colors (and of full tubes).
+                colors_in_tube (int): The tube capacity.
+
+            Returns:
+                np.ndarray: A (boards, colors, colors_in_tube) uint8 array, bottom to top per tube.
+    """
+    units = np.repeat(np.arange(colors, dtype=np.uint8), colors_in_tube)
+    boards = rng.permuted(np.broadcast_to(units, (count, units.size)), axis=1)
+    boards = boards.reshape(count, colors, colors_in_tube)
+    solved = (boards == boards[:, :, :1]).all(axis=(1, 2))
+    return boards[~solved]
+
+
+def to_tubes(board, empty_tubes):
+    """Convert a (colors, colors_in_tube) board array to the game's list of tubes."""
+    return board.tolist() + [[] for _ in range(empty_tubes)]
+
+
+def rate_board(job):
+    """Certify one board with a node-limited search and rate its difficulty.
+            Args:
+                job (tuple): (board array, empty tubes, node limit, optimal flag).
+
+            Returns:
+                Tuple[int, int, float]: The solution length, expanded nodes and branching factor,
+                or None if no solution was found within the node limit.
+    """
+    board, empty_tubes, node_limit, optimal = job
+    colors, colors_in_tube = board.shape
+    config = SimpleNamespace(NColor=colors, NEmptyTubes=empty_tubes, NColorInTube=colors_in_tube)
+
+    def stop_at_limit(stats):
+        if stats.nodes_expanded >= node_limit:
+            solution.cancel()
+
+    # An interval of 0 calls the progress hook after every expansion
+    solution = GameSolution(config, progress=stop_at_limit, progress_interval=0.0)
+    tubes = to_tubes(board, empty_tubes)
+    if optimal:
+        solution.optimal_solve(tubes)
+    else:
+        solution.best_first_solve(tubes, weight=2.0)
+    if not solution.solution_found:
+        return None
+    stats = solution.stats
+    branching = stats.nodes_generated / stats.nodes_expanded if stats.nodes_expanded else 0.0
+    return len(solution.moves), stats.nodes_expanded, branching
+
+
+def generate(output, colors, empty_tubes, colors_in_tube, count, seed=None, workers=None,
+             node_limit=20000, optimal=False, batch_size=10000):
+    """Generate certified puzzles and append them to a pack file as they are rated.
+            Args:
+                output (str): The pack file; a header is written first.
+                colors (int): The number of colors.
+                empty_tubes (int): The number of empty tubes.
+                colors_in_tube (int): The tube capacity.
+                count (int): The number of certified puzzles to write.
+                seed (int): The seed of the board generator.
+                workers (int): The number of certifying processes, all cores by default.
+                node_limit (int): Boards not solved within this many expansions are dropped.
+                optimal (bool): Rate with the optimal (IDA*) solver instead of weighted A*.
+                batch_size (int): The number of boards shuffled at once.
+
+            Returns:
+                int: The number of boards drawn to obtain ``count`` certified puzzles.
+    """
+    rng = np.random.default_rng(seed)
+    dtype = record_dtype(colors, colors_in_tube)
+    written = drawn = 0
+    with open(output, "wb") as out, Pool(workers) as pool:
+        out.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, colors, empty_tubes, colors_in_tube))
+        while written < count:
+            boards = random_boards(rng, min(batch_size, 2 * (count - written) + 64), colors, colors_in_tube)
+            drawn += len(boards)
+            jobs = ((board, empty_tubes, node_limit, optimal) for board in boards)
+            ratings = pool.imap(rate_board, jobs, chunksize=64)
+            records = np.zeros(len(boards), dtype)
+            kept = 0
+            for board, rating in zip(boards, ratings):
+                if rating is None:
+                    continue
+                records[kept] = (board.ravel(), *rating)
+                kept += 1
+                if written + kept == count:
+                    break
+            records[:kept].tofile(out)
+            out.flush()
+            written += kept
+    return drawn
+
+
+def read_pack(path):
+    """Open a pack file without loading it into memory.
+            Args:
+                path (str): The pack file.
+
+            Returns:
+                Tuple[Tuple[int, int, int], np.ndarray]: (colors, empty tubes, colors in tube) and
+                a read-only memory map of the records.
+    """
+    with open(path, "rb") as pack:
+        magic, version, colors, empty_tubes, colors_in_tube = PACK_HEADER.unpack(pack.read(PACK_HEADER.size))
+    if magic != PACK_MAGIC or version != PACK_VERSION:
+        raise ValueError(f"{path} is not a version {PACK_VERSION} puzzle pack")
+    records = np.memmap(path, dtype=record_dtype(colors, colors_in_tube), mode="r", offset=PACK_HEADER.size)
+    return (colors, empty_tubes, colors_in_tube), records
+
+
+class PuzzlePack:
+    """The boards of a pack file, handed out in a seeded random order.
+
+        Attributes:
+            colors (int): The number of colors of every board.
+            empty_tubes (int): The number of empty tubes of every board.
+            colors_in_tube (int): The tube capacity of every board.
+            records (np.ndarray): The memory-mapped records.
+    """
+    def __init__(self, path, seed=None):
+        (self.colors, self.empty_tubes, self.colors_in_tube), self.records = read_pack(path)
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.records)
+
+    def board(self, index):
+        """Return board ``index`` as the game's list of tubes."""
+        board = self.records[index]["board"].reshape(self.colors, self.colors_in_tube)
+        return to_tubes(board, self.empty_tubes)
+
+    def random_board(self):
+        """Return a random board of the pack as the game's list of tubes."""
+        return self.board(self.rng.integers(len(self.records)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a pack of certified-solvable water sort puzzles.")
+    parser.add_argument("--colors", type=int, default=6, help="NColor")
+    parser.add_argument("--empty-tubes", type=int, default=2, help="NEmptyTubes")
+    parser.add_argument("--colors-in-tube", type=int, default=4, help="CTube")
+    parser.add_argument("--count", type=int, default=1000, help="number of certified puzzles to write")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="certifying processes, all cores by default")
+    parser.add_argument("--node-limit", type=int, default=20000, help="expansions allowed per certificate")
+    parser.add_argument("--optimal", action="store_true", help="rate by optimal solution length (slower)")
+    parser.add_argument("--output", required=True, help="pack file to write")
+    args = parser.parse_args(argv)
+    drawn = generate(args.output, args.colors, args.empty_tubes, args.colors_in_tube, args.count, args.seed,
+                     args.workers, args.node_limit, args.optimal)
+    print(f"wrote {args.count} puzzles to {args.output} ({drawn} boards drawn)")
+
+
+if __name__ == "__main__":
+    main()
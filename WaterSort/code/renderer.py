@@ -0,0 +1,112 @@
+# Cached fonts and text, and dirty-rectangle drawing for the game window
+import functools
+import pygame
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(name, size):
+    """Return a shared font; SysFont searches the installed fonts, so each size is created once."""
+    return pygame.font.SysFont(name, size)
+
+
+@functools.lru_cache(maxsize=512)
+def render_text(text, size, color, name="Arial"):
+    """Return a cached anti-aliased text surface.
+            Args:
+                text (str): The text to render.
+                size (int): The font size.
+                color (str | tuple): The text color.
+                name (str): The font name.
+
+            Returns:
+                pygame.Surface: The rendered text; callers must not draw on it.
+    """
+    return get_font(name, size).render(text, True, color)
+
+
+class Renderer:
+    """Redraws only the parts of the screen whose state changed.
+
+        Every part of the screen is a region with a key, a signature describing what it shows and
+        a draw function returning the rectangle it covered. A region is only cleared and redrawn
+        when its signature differs from the previous frame, and only the changed rectangles are
+        sent to the display, so frames with nothing new do not touch the display at all.
+
+        Attributes:
+            screen (pygame.Surface): The window surface.
+            background (tuple): The color used to clear regions.
+            regions (dict): Region key -> (signature, rect) of what is currently on screen.
+            dirty (list): The rectangles changed since the last present().
+            full (bool): True when the whole screen must be redrawn and flipped.
+    """
+    def __init__(self, screen, background=(0, 0, 0)):
+        self.screen = screen
+        self.background = background
+        self.regions = {}
+        self.dirty = []
+        self.full = True
+
+    def invalidate(self):
+        """Redraw every region on the next frame, e.g. after the layout changed or under an overlay."""
+        self.regions.clear()
+        self.full = True
+
+    def begin(self):
+        """Start a frame; clears the screen if a full redraw is pending."""
+        if self.full:
+            self.screen.fill(self.background)
+
+    def region(self, key, signature, draw):
+        """Draw a region if its signature changed since it was last drawn.
+                Args:
+                    key (Hashable): The identity of the region.
+                    signature (Hashable): A value that changes whenever the region looks different.
+                    draw (Callable[[], pygame.Rect]): Draws the region and returns the rectangle it covered.
+
+                Returns:
+                    pygame.Rect: The rectangle covered by the region.
+        """
+        old = self.regions.get(key)
+        if old is not None and old[0] == signature:
+            return old[1]
+        if old is not None:
+            self.screen.fill(self.background, old[1])
+        rect = pygame.Rect(draw())
+        self.regions[key] = (signature, rect)
+        if not self.full:
+            self.dirty.append(rect.union(old[1]) if old is not None else rect)
+        return rect
+
+    def overlay(self, key, signature, draw):
+        """Draw a region that lies on top of others, after all other regions of the frame.
+            It is drawn again, without clearing, whenever it changed or anything else was redrawn, so
+            it stays on top. Only opaque overlays may change their signature while they are shown.
+                Args:
+                    key (Hashable): The identity of the region.
+                    signature (Hashable): A value that changes whenever the overlay looks different.
+                    draw (Callable[[], pygame.Rect]): Draws the overlay and returns the rectangle it covered.
+        """
+        old = self.regions.get(key)
+        if old is not None and old[0] == signature and not self.dirty:
+            return old[1]
+        rect = pygame.Rect(draw())
+        self.regions[key] = (signature, rect)
+        if not self.full:
+            self.dirty.append(rect)
+        return rect
+
+    def erase(self, key):
+        """Clear a region that is no longer shown."""
+        old = self.regions.pop(key, None)
+        if old is not None:
+            self.screen.fill(self.background, old[1])
+            self.dirty.append(old[1])
+
+    def present(self):
+        """Send the changed parts of the frame to the display, if any."""
+        if self.full:
+            pygame.display.flip()
+            self.full = False
+        elif self.dirty:
+            pygame.display.update(self.dirty)
+        self.dirty = []
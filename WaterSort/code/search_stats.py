@@ -0,0 +1,102 @@
+# Counters and timers filled in by the GameSolution searches
+import time
+
+
+class SearchStats:
+    """Statistics of one solver run.
+
+        Attributes:
+            nodes_expanded (int): The number of states whose children were generated.
+            nodes_generated (int): The number of child states produced.
+            duplicate_hits (int): The number of children dropped because their key was already visited.
+            frontier_size (int): The current number of states waiting to be expanded.
+            visited_size (int): The current number of visited keys.
+            peak_frontier (int): The largest frontier size seen.
+            peak_visited (int): The largest visited set size seen.
+            expansion_time (float): Seconds spent generating children.
+            hashing_time (float): Seconds spent building state keys and checking the visited set.
+            heuristic_time (float): Seconds spent evaluating the heuristic.
+            callback (Callable[[SearchStats], None]): Called with the stats every ``interval`` seconds.
+            interval (float): The number of seconds between two callback calls.
+    """
+    def __init__(self, callback=None, interval=1.0):
+        self.nodes_expanded = 0
+        self.nodes_generated = 0
+        self.duplicate_hits = 0
+        self.frontier_size = 0
+        self.visited_size = 0
+        self.peak_frontier = 0
+        self.peak_visited = 0
+        self.expansion_time = 0.0
+        self.hashing_time = 0.0
+        self.heuristic_time = 0.0
+        self.callback = callback
+        self.interval = interval
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self._next_report = self.start_time + interval
+
+    @property
+    def elapsed(self):
+        """Seconds since the search started, or its total duration once it has finished."""
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    @property
+    def duplicate_rate(self):
+        """The share of generated children that were already visited."""
+        return self.duplicate_hits / self.nodes_generated if self.nodes_generated else 0.0
+
+    @property
+    def nodes_per_second(self):
+        """The number of expanded states per second."""
+        elapsed = self.elapsed
+        return self.nodes_expanded / elapsed if elapsed > 0 else 0.0
+
+    def expanded(self, frontier_size, visited_size, now, count=1):
+        """Record expansions and call the callback when its interval has passed.
+                Args:
+                    frontier_size (int): The frontier size after the expansion.
+                    visited_size (int): The visited set size after the expansion.
+                    now (float): The current ``time.perf_counter()`` value.
+                    count (int): The number of states expanded, for searches working on batches.
+        """
+        self.nodes_expanded += count
+        self.frontier_size = frontier_size
+        self.visited_size = visited_size
+        if frontier_size > self.peak_frontier:
+            self.peak_frontier = frontier_size
+        if visited_size > self.peak_visited:
+            self.peak_visited = visited_size
+        if self.callback is not None and now >= self._next_report:
+            self._next_report = now + self.interval
+            self.callback(self)
+
+    def finish(self):
+        """Stop the clock."""
+        self.end_time = time.perf_counter()
+
+    def merge(self, other):
+        """Add the counters and timers of another run, e.g. a parallel worker."""
+        self.nodes_expanded += other.nodes_expanded
+        self.nodes_generated += other.nodes_generated
+        self.duplicate_hits += other.duplicate_hits
+        self.peak_frontier = max(self.peak_frontier, other.peak_frontier)
+        self.peak_visited = max(self.peak_visited, other.peak_visited)
+        self.expansion_time += other.expansion_time
+        self.hashing_time += other.hashing_time
+        self.heuristic_time += other.heuristic_time
+
+    def as_dict(self):
+        """Return the statistics as a JSON-friendly dict."""
+        return dict(nodes_expanded=self.nodes_expanded, nodes_generated=self.nodes_generated,
+                    duplicate_hits=self.duplicate_hits, duplicate_rate=round(self.duplicate_rate, 4),
+                    peak_frontier=self.peak_frontier, peak_visited=self.peak_visited,
+                    expansion_time=round(self.expansion_time, 6), hashing_time=round(self.hashing_time, 6),
+                    heuristic_time=round(self.heuristic_time, 6), elapsed=round(self.elapsed, 6),
+                    nodes_per_second=round(self.nodes_per_second))
+
+    def __getstate__(self):
+        # The callback usually belongs to the caller's process and is not sent to pool workers
+        state = self.__dict__.copy()
+        state["callback"] = None
+        return state
@@ -0,0 +1,116 @@
+# Persistent store of solved boards
+import sqlite3
+import threading
+import time
+from packed_board import PackedBoard
+
+
+class SolutionCache:
+    """An sqlite file mapping boards to the moves that solve them.
+
+        Boards are keyed by the tube capacity and the canonical (tube-order independent) packed
+        state, and moves are stored as canonical tube positions, so a board is found again after
+        its tubes are shuffled. Every position along a stored solution is saved with the rest of
+        the moves. The least recently used entries are deleted once max_entries is exceeded.
+
+        Attributes:
+            path (str): The sqlite file.
+            max_entries (int): The maximum number of stored positions.
+            hits (int): The number of successful lookups.
+            misses (int): The number of failed lookups.
+    """
+    def __init__(self, path, max_entries=200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # The game looks boards up from its main thread and stores them from the solver thread
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS solutions ("
+                         "key BLOB PRIMARY KEY, moves BLOB NOT NULL, optimal INTEGER NOT NULL, "
+                         "last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def _board(tube_colors, capacity):
+        return PackedBoard(len(tube_colors), capacity)
+
+    @staticmethod
+    def _key(board, state):
+        return bytes((board.capacity,)) + board.canonical(state)
+
+    def get(self, tube_colors, capacity, optimal=False):
+        """Look up a stored solution for a board.
+                Args:
+                    tube_colors (List[List[int]]): The colors in each tube.
+                    capacity (int): The maximum number of colors in a single tube.
+                    optimal (bool): Only accept solutions that are known to be shortest.
+
+                Returns:
+                    List[Tuple[int, int]]: The (src, dst) moves in the tube order of ``tube_colors``,
+                    or None if the board is not stored.
+        """
+        board = self._board(tube_colors, capacity)
+        state = board.pack(tube_colors)
+        key = self._key(board, state)
+        with self._lock:
+            row = self._db.execute("SELECT moves, optimal FROM solutions WHERE key = ?", (key,)).fetchone()
+            if row is None or (optimal and not row[1]):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE solutions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+        order = board.canonical_order(state)
+        packed = row[0]
+        return [(order[packed[k]], order[packed[k + 1]]) for k in range(0, len(packed), 2)]
+
+    def put(self, tube_colors, capacity, moves, optimal=False):
+        """Store a solution together with the solutions of every position along it.
+                Args:
+                    tube_colors (List[List[int]]): The colors in each tube.
+                    capacity (int): The maximum number of colors in a single tube.
+                    moves (List[Tuple[int, int]]): The (src, dst) moves that solve the board.
+                    optimal (bool): True if ``moves`` is a shortest solution.
+        """
+        board = self._board(tube_colors, capacity)
+        state = board.pack(tube_colors)
+        rows = []
+        now = time.time()
+        for step, (src, dst) in enumerate(moves):
+            order = board.canonical_order(state)
+            position = {tube: c for c, tube in enumerate(order)}
+            packed = bytes(position[tube] for move in moves[step:] for tube in move)
+            # Positions near the queried board count as more recently used, so they are evicted last
+            rows.append((self._key(board, state), packed, int(optimal), now - step * 1e-6))
+            state = board.apply(state, src, dst)
+            if state is None:
+                raise ValueError(f"move {step} {(src, dst)} is not legal")
+        with self._lock:
+            # Keep the shorter solution, and prefer a proven optimal one of the same length
+            self._db.executemany("INSERT INTO solutions (key, moves, optimal, last_used) VALUES (?, ?, ?, ?) "
+                                 "ON CONFLICT (key) DO UPDATE SET moves = excluded.moves, "
+                                 "optimal = excluded.optimal, last_used = excluded.last_used "
+                                 "WHERE length(excluded.moves) < length(solutions.moves) "
+                                 "OR (length(excluded.moves) = length(solutions.moves) "
+                                 "AND excluded.optimal > solutions.optimal)", rows)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # Delete the least recently used rows beyond max_entries
+        extra = self._db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0] - self.max_entries
+        if extra > 0:
+            self._db.execute("DELETE FROM solutions WHERE key IN "
+                             "(SELECT key FROM solutions ORDER BY last_used LIMIT ?)", (extra,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def close(self):
+        """Close the sqlite connection."""
+        with self._lock:
+            self._db.close()